@@ -0,0 +1,177 @@
+# dropmunch - data file archival
+# - moves data files out of the data directory once they are processed, so that
+#   each run only scans new files :
+# -   complete files are compressed into a dated archive tree,
+#     <archive directory>/<YYYY>/<MM>/<DD>/<data file>.<codec extension>,
+#     dated by the data file timestamp
+# -   failed files are moved, uncompressed, into the quarantine directory
+# - files are archived by a worker thread, so that ingestion never waits on
+#   compression. close() waits for queued files to be archived
+# - archived files older than retention_days are deleted, along with emptied
+#   date directories
+# - archived files can be restored into the data directory, e.g. to be reloaded
+#   in replace mode. They are archived again once they are loaded
+import bz2
+import gzip
+import logging
+import lzma
+import os
+import queue
+import shutil
+import threading
+import time
+
+codecs = {
+    'gzip': (gzip.open, '.gz'),
+    'bz2': (bz2.open, '.bz2'),
+    'lzma': (lzma.open, '.xz'),
+    'none': (open, ''),
+}
+default_codec = 'gzip'
+default_archive_directory = '/archive/'
+default_quarantine_directory = '/quarantine/'
+# 0 keeps archived files forever
+default_retention_days = 0
+inprogress_suffix = '.inprogress'
+
+
+def get_archived_file(archived):
+    """Returns the data file name of an archived file, and the function which opens it, whichever
+       codec it was archived with. The name is None for a partial archive"""
+    if archived.endswith(inprogress_suffix):
+        return None, None
+    for opener, extension in codecs.values():
+        if extension != '' and archived.endswith(extension):
+            return archived[:-len(extension)], opener
+    return archived, open
+
+
+class MunchArchive:
+    def __init__(self, data_directory, archive_directory, quarantine_directory, codec=default_codec,
+                 retention_days=default_retention_days):
+        if codec not in codecs:
+            raise ValueError('archive codec {0} is not one of {1}'.format(codec, sorted(codecs)))
+
+        self.data_directory = data_directory
+        self.archive_directory = archive_directory
+        self.quarantine_directory = quarantine_directory
+        self.codec = codec
+        self.retention_days = retention_days
+        self.log = logging.getLogger('MunchArchive')
+        self.queue = queue.Queue()
+        self.worker = None
+        # files of a drop root may be archived by several workers - only one archive thread is started
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.worker is None:
+                # a daemon thread, so that a run which never reaches close() can still exit. An
+                # interrupted archive leaves the data file in place, and is retried by the next run
+                self.worker = threading.Thread(target=self.run, name='archive', daemon=True)
+                self.worker.start()
+
+    def archive(self, file, timestamp):
+        """Queues a complete data file to be compressed into the archive tree"""
+        self.start()
+        self.queue.put((self.archive_file, file, timestamp))
+
+    def quarantine(self, file):
+        """Queues a failed data file to be moved into the quarantine directory"""
+        self.start()
+        self.queue.put((self.quarantine_file, file))
+
+    def close(self):
+        """Waits for queued files to be archived, then prunes expired archives"""
+        with self.lock:
+            worker, self.worker = self.worker, None
+        if worker is not None:
+            self.queue.put(None)
+            worker.join()
+        self.prune()
+
+    def run(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                return
+            try:
+                task[0](*task[1:])
+            except Exception as e:
+                self.log.error('Failed to archive data file {0}. Error : {1}'.format(task[1], e))
+
+    def get_archive_path(self, file, timestamp):
+        return os.path.join(self.archive_directory, timestamp.strftime('%Y'), timestamp.strftime('%m'),
+                            timestamp.strftime('%d'), file + codecs[self.codec][1])
+
+    def archive_file(self, file, timestamp):
+        path = self.get_archive_path(file, timestamp)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # written under a temporary name, so that a partial archive is never mistaken for a complete one
+        with open(self.data_directory + file, 'rb') as datafile, \
+                codecs[self.codec][0](path + inprogress_suffix, 'wb') as archived:
+            shutil.copyfileobj(datafile, archived)
+        os.replace(path + inprogress_suffix, path)
+        os.remove(self.data_directory + file)
+        self.log.info('Archived data file {0} to {1}'.format(file, path))
+
+    def quarantine_file(self, file):
+        os.makedirs(self.quarantine_directory, exist_ok=True)
+        shutil.move(self.data_directory + file, os.path.join(self.quarantine_directory, file))
+        self.log.warning('Quarantined data file {0} in {1}'.format(file, self.quarantine_directory))
+
+    def restore(self, selected):
+        """Decompresses the archived data files whose names are selected back into the data directory.
+           Files which are already in the data directory are left alone. Returns the restored file names"""
+        restored = []
+        if not os.path.isdir(self.archive_directory):
+            return restored
+
+        for directory, _, files in os.walk(self.archive_directory):
+            for archived in sorted(files):
+                file, opener = get_archived_file(archived)
+                if file is None or not selected(file) or os.path.exists(self.data_directory + file):
+                    continue
+                # written under a temporary name, so that a partial file is never loaded
+                with opener(os.path.join(directory, archived), 'rb') as archived_file, \
+                        open(self.data_directory + file + inprogress_suffix, 'wb') as datafile:
+                    shutil.copyfileobj(archived_file, datafile)
+                os.replace(self.data_directory + file + inprogress_suffix, self.data_directory + file)
+                restored.append(file)
+                self.log.info('Restored data file {0} from {1}'.format(file, directory))
+        return restored
+
+    def prune(self, now=None):
+        """Deletes archived files older than retention_days. Returns the number deleted"""
+        if self.retention_days <= 0 or not os.path.isdir(self.archive_directory):
+            return 0
+
+        expires = (now if now is not None else time.time()) - self.retention_days * 86400
+        deleted = 0
+        for directory, _, files in os.walk(self.archive_directory, topdown=False):
+            for file in files:
+                path = os.path.join(directory, file)
+                if os.path.getmtime(path) < expires:
+                    os.remove(path)
+                    deleted += 1
+            if os.path.normpath(directory) != os.path.normpath(self.archive_directory) and \
+                    len(os.listdir(directory)) == 0:
+                os.rmdir(directory)
+
+        if deleted > 0:
+            self.log.info('Deleted {0} archived data files older than {1} days'.format(deleted, self.retention_days))
+        return deleted
+
+
+def create_archive(config, working_directory, data_directory):
+    """Returns a MunchArchive if archival is enabled in the [archive] config section, otherwise None"""
+    if not config.get('archive', 'enabled', False, bool):
+        return None
+
+    return MunchArchive(data_directory,
+                        config.get('archive', 'directory', working_directory + default_archive_directory),
+                        config.get('archive', 'quarantine_directory',
+                                   working_directory + default_quarantine_directory),
+                        config.get('archive', 'codec', default_codec),
+                        config.get('archive', 'retention_days', default_retention_days, int))
@@ -0,0 +1,76 @@
+# dropmunch - columnar row batches
+# - holds the parsed rows of a data file between the parser and the sinks,
+#   statistics and export, without a list or dict per row :
+# -   one list per stored spec column, preallocated to the batch capacity, which
+#     values are parsed straight into - see Spec.parse_into
+# -   a single import_log_id for the batch, rather than a value per row
+# - a batch is cleared and refilled for each batch of a data file, so its
+#   column buffers are reused rather than reallocated
+# - rows are still available as tuples of import_log_id followed by the spec
+#   column values, for consumers which work row by row
+import itertools
+
+
+class RowBatch:
+    __slots__ = ('import_log_id', 'columns', 'size')
+
+    def __init__(self, spec, import_log_id, capacity):
+        self.import_log_id = import_log_id
+        self.columns = [[None] * capacity for _ in spec.columns]
+        self.size = 0
+
+    @classmethod
+    def from_rows(cls, spec, rows):
+        """Builds a batch from rows of import_log_id followed by the spec column values"""
+        batch = cls(spec, rows[0][0] if rows else None, len(rows))
+        for row in rows:
+            batch.append(row[1:])
+        return batch
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        if not self.columns:
+            return iter(())
+        return zip(itertools.repeat(self.import_log_id),
+                   *[itertools.islice(column, self.size) for column in self.columns])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            batch = RowBatch.__new__(RowBatch)
+            batch.import_log_id = self.import_log_id
+            batch.columns = [column[:self.size][index] for column in self.columns]
+            batch.size = len(batch.columns[0]) if batch.columns else 0
+            return batch
+
+        if not -self.size <= index < self.size:
+            raise IndexError('row {0} is not in a batch of {1} rows'.format(index, self.size))
+        return (self.import_log_id,) + tuple(column[index % self.size] for column in self.columns)
+
+    def append_record(self, spec, record, encoding):
+        """Parses a record into the next row of the batch. Returns False if the record is invalid"""
+        self.reserve()
+        if not spec.parse_into(record, self.columns, self.size, encoding):
+            return False
+        self.size += 1
+        return True
+
+    def append(self, values):
+        self.reserve()
+        for column, value in zip(self.columns, values):
+            column[self.size] = value
+        self.size += 1
+
+    def reserve(self):
+        # a batch only grows beyond its capacity when it is used to collect a whole file
+        if self.columns and self.size == len(self.columns[0]):
+            for column in self.columns:
+                column.append(None)
+
+    def get_columns(self):
+        """Returns the values of each spec column, in spec order"""
+        return [column[:self.size] for column in self.columns]
+
+    def clear(self):
+        self.size = 0
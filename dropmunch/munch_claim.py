@@ -0,0 +1,148 @@
+# dropmunch - data file claims
+# - lets several dropmunch nodes share a drop directory. Before a node loads a
+#   data file, it claims the file's import_log row :
+# -   SELECT ... FOR UPDATE SKIP LOCKED, so nodes never wait on each other
+# -   the claim is a lease, renewed by a heartbeat thread while the file loads
+# -   a file whose owner's lease expired may be taken over by another node. Rows
+#     loaded by the previous owner are purged, and the file is loaded from the start
+# -   every sink commit is fenced by the claim : the claimed row is locked FOR SHARE and
+#     checked in the same transaction as the rows, so a node which lost its claim can't
+#     commit rows after the new owner purged them - see MunchSink.fence
+# - requires a postgres catalog database, which the postgres sink writes to
+import logging
+import os
+import socket
+import threading
+
+default_lease_seconds = 300
+
+claim_sql = """
+WITH candidate AS (
+    SELECT id, claimed_by AS previous_owner
+    FROM import_log
+    WHERE id = :import_log_id
+      AND import_status <> 'complete'
+      AND (claimed_by IS NULL OR claimed_by = :node_id OR lease_expires < now())
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE import_log
+SET claimed_by = :node_id,
+    lease_expires = now() + make_interval(secs => :lease_seconds),
+    num_rows_processed = CASE WHEN candidate.previous_owner <> :node_id THEN 0
+                              ELSE import_log.num_rows_processed END
+FROM candidate
+WHERE import_log.id = candidate.id
+RETURNING import_log.*, candidate.previous_owner
+"""
+
+heartbeat_sql = """
+UPDATE import_log
+SET lease_expires = now() + make_interval(secs => :lease_seconds)
+WHERE id = :import_log_id AND claimed_by = :node_id
+RETURNING id
+"""
+
+# the sink appends FOR SHARE on postgres
+fence_sql = """
+SELECT id FROM import_log
+WHERE id = :import_log_id AND claimed_by = :node_id
+"""
+
+release_sql = """
+UPDATE import_log
+SET claimed_by = NULL, lease_expires = NULL
+WHERE id = :import_log_id AND claimed_by = :node_id
+"""
+
+
+class ClaimLost(Exception):
+    """Raised when a node's lease on a data file has been lost, e.g. taken over by another node"""
+
+
+def get_default_node_id():
+    return '{0}:{1}'.format(socket.gethostname(), os.getpid())
+
+
+class Heartbeat(threading.Thread):
+    """Renews the lease on a claimed import_log row until stopped"""
+    def __init__(self, claim, import_log_id):
+        threading.Thread.__init__(self, name='heartbeat-{0}'.format(import_log_id), daemon=True)
+        self.claim = claim
+        self.import_log_id = import_log_id
+        self.stopped = threading.Event()
+        self.lost = False
+
+    def run(self):
+        while not self.stopped.wait(self.claim.lease_seconds / 3.0):
+            if not self.claim.renew(self.import_log_id):
+                self.lost = True
+                return
+
+    def stop(self):
+        self.stopped.set()
+
+    def check(self):
+        if self.lost:
+            raise ClaimLost('Lease on import_log id {0} was lost'.format(self.import_log_id))
+
+
+class MunchClaim:
+    def __init__(self, db, node_id=None, lease_seconds=default_lease_seconds):
+        self.db = db
+        self.node_id = node_id if node_id is not None else get_default_node_id()
+        self.lease_seconds = lease_seconds
+        self.log = logging.getLogger('MunchClaim')
+
+    def execute(self, sql, **params):
+        with self.db as transaction:
+            return list(transaction.query(sql, node_id=self.node_id, **params))
+
+    def claim(self, import_log_id):
+        """Returns the claimed import_log row, including the previous owner in 'previous_owner',
+           or None if the file is complete or claimed by another live node"""
+        try:
+            rows = self.execute(claim_sql, import_log_id=import_log_id, lease_seconds=self.lease_seconds)
+        except Exception as e:
+            self.log.error('Failed to claim import_log id {0}. Error : {1}'.format(import_log_id, e))
+            return None
+
+        if len(rows) == 0:
+            return None
+
+        import_log_row = rows[0]
+        if self.is_takeover(import_log_row):
+            self.log.warn('Node {0} took over import_log id {1} from node {2}, whose lease expired'
+                          .format(self.node_id, import_log_id, import_log_row['previous_owner']))
+        return import_log_row
+
+    def is_takeover(self, import_log_row):
+        return import_log_row['previous_owner'] not in (None, self.node_id)
+
+    def renew(self, import_log_id):
+        try:
+            return len(self.execute(heartbeat_sql, import_log_id=import_log_id,
+                                    lease_seconds=self.lease_seconds)) > 0
+        except Exception as e:
+            self.log.error('Failed to renew lease on import_log id {0}. Error : {1}'.format(import_log_id, e))
+            return False
+
+    def release(self, import_log_id):
+        try:
+            self.execute(release_sql, import_log_id=import_log_id)
+        except Exception as e:
+            self.log.warn('Failed to release claim on import_log id {0}. Error : {1}'.format(import_log_id, e))
+
+    def start_heartbeat(self, import_log_id):
+        heartbeat = Heartbeat(self, import_log_id)
+        heartbeat.start()
+        return heartbeat
+
+
+def create_claim(config, db):
+    """Returns a MunchClaim if claims are enabled in the [claim] config section, otherwise None"""
+    if not config.get('claim', 'enabled', False, bool):
+        return None
+
+    return MunchClaim(db,
+                      config.get('claim', 'node_id'),
+                      config.get('claim', 'lease_seconds', default_lease_seconds, int))
@@ -0,0 +1,144 @@
+# dropmunch - columnar export
+# - optionally writes the rows of each data file, as they are ingested, to a
+#   columnar file in the export directory :
+# -   parquet : one row group per committed batch
+# -   arrow   : Arrow IPC file, one record batch per committed batch
+# - the schema is derived from the spec columns and their SpecDataType - DECIMAL
+#   columns keep their scale
+# - files are written under a temporary name, and renamed once complete
+# - requires pyarrow, which is an optional dependency
+import itertools
+import logging
+import os
+from dropmunch import munch_spec
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+export_formats = ['parquet', 'arrow']
+default_export_directory = '/export/'
+# Arrow IPC files only support lz4 and zstd
+default_compressions = {'parquet': 'snappy', 'arrow': 'lz4'}
+inprogress_suffix = '.inprogress'
+
+
+# largest precision of a decimal128
+max_decimal_precision = 38
+
+
+def get_arrow_type(spec_column):
+    spec_datatype = munch_spec.SpecDataType[spec_column.datatype]
+
+    if spec_datatype == munch_spec.SpecDataType.TEXT:
+        return pyarrow.string()
+    elif spec_datatype == munch_spec.SpecDataType.INTEGER:
+        return pyarrow.int64()
+    elif spec_datatype == munch_spec.SpecDataType.BOOLEAN:
+        return pyarrow.bool_()
+    elif spec_datatype == munch_spec.SpecDataType.DECIMAL:
+        return pyarrow.decimal128(min(max(spec_column.width, spec_column.scale), max_decimal_precision),
+                                  spec_column.scale)
+    elif spec_datatype == munch_spec.SpecDataType.DATE:
+        return pyarrow.date32()
+    elif spec_datatype == munch_spec.SpecDataType.TIMESTAMP:
+        return pyarrow.timestamp('us')
+    elif spec_datatype == munch_spec.SpecDataType.FLOAT:
+        return pyarrow.float64()
+
+    raise ValueError('datatype {0} is not implemented'.format(spec_column.datatype))
+
+
+def get_arrow_schema(spec):
+    fields = [pyarrow.field('import_log_id', pyarrow.int64(), nullable=False)]
+
+    for spec_column in spec.columns:
+        fields.append(pyarrow.field(spec_column.name, get_arrow_type(spec_column),
+                                    nullable=spec_column.nullable))
+
+    return pyarrow.schema(fields)
+
+
+class ColumnarExport:
+    def __init__(self, path, spec, export_format, compression):
+        self.path = path
+        self.spec = spec
+        self.schema = get_arrow_schema(spec)
+        self.row_count = 0
+        self.failed = False
+
+        if export_format == 'parquet':
+            self.writer = pyarrow.parquet.ParquetWriter(path + inprogress_suffix, self.schema,
+                                                        compression=compression)
+        else:
+            options = pyarrow.ipc.IpcWriteOptions(compression=None if compression == 'none' else compression)
+            self.writer = pyarrow.ipc.new_file(path + inprogress_suffix, self.schema, options=options)
+
+    def write_batch(self, batch):
+        """Writes a munch_batch.RowBatch, column by column"""
+        arrays = [pyarrow.array(itertools.repeat(batch.import_log_id, len(batch)), type=pyarrow.int64(),
+                                size=len(batch))]
+        arrays += [pyarrow.array(column, type=field.type)
+                   for column, field in zip(batch.get_columns(), list(self.schema)[1:])]
+        self.writer.write_batch(pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema))
+        self.row_count += len(batch)
+
+    def close(self):
+        self.writer.close()
+        os.replace(self.path + inprogress_suffix, self.path)
+
+    def abort(self):
+        self.failed = True
+        try:
+            self.writer.close()
+        finally:
+            os.remove(self.path + inprogress_suffix)
+
+
+class MunchExport:
+    def __init__(self, export_directory, export_format='parquet', compression=None):
+        if export_format not in export_formats:
+            raise ValueError('export format {0} is not one of {1}'.format(export_format, export_formats))
+
+        self.export_directory = export_directory
+        self.export_format = export_format
+        self.compression = compression if compression is not None else default_compressions[export_format]
+        self.log = logging.getLogger('MunchExport')
+
+    def get_export_filename(self, file):
+        return os.path.splitext(file)[0] + '.' + self.export_format
+
+    def open(self, file, spec):
+        """Returns a ColumnarExport for the data file, or None if it can't be created"""
+        path = self.export_directory + self.get_export_filename(file)
+        try:
+            os.makedirs(self.export_directory, exist_ok=True)
+            return ColumnarExport(path, spec, self.export_format, self.compression)
+        except Exception as e:
+            self.log.error('Failed to create {0} export {1}. Error : {2}'.format(self.export_format, path, e))
+            return None
+
+
+def create_export(config, working_directory):
+    """Returns a MunchExport if export is enabled in the [export] config section, otherwise None"""
+    if not config.get('export', 'enabled', False, bool):
+        return None
+
+    if pyarrow is None:
+        logging.getLogger('MunchExport').error('Columnar export is enabled, but pyarrow isn\'t installed. '
+                                               'Data files will not be exported')
+        return None
+
+    export_format = config.get('export', 'format', 'parquet')
+    if export_format not in export_formats:
+        logging.getLogger('MunchExport').error('Export format {0} is not one of {1}. '
+                                               'Data files will not be exported'.format(export_format,
+                                                                                        export_formats))
+        return None
+
+    return MunchExport(config.get('export', 'directory', working_directory + default_export_directory),
+                       export_format,
+                       config.get('export', 'compression'))
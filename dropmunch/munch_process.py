@@ -1,23 +1,44 @@
-"""Usage: munch_process.py [-hvc -V]
+"""Usage:
+  munch_process.py [-hvc -V] [--replace [--spec=<name>] [--file=<file>]] [--schedule=<policy>] [--sink=<sink>]
+  munch_process.py --stdin --spec=<name> --timestamp=<timestamp> [-vc -V] [--replace] [--sink=<sink>]
 
 Entry point for dropmunch
-- ensures that this is the only dropmunch process in progress in the current working directory
+- ensures that this is the only dropmunch process in progress in the current working directory,
+  unless claims are enabled in dropmunch.ini - nodes then coordinate through import_log claims
 - processes any new spec files
+  (of the working directory, or of each drop root configured in dropmunch.ini - see munch_roots)
 - processes any new data files that have a corresponding spec
 - cleans up after itself
+- with --stdin, instead loads a single data file streamed through stdin, for a spec which
+  has already been processed. Data files in the data directory may also be named pipes
 
 Options:
   -h --help
   -v      verbose (log level INFO)
   -V      more verbose (log level DEBUG). Warning - outputs DB credentials!
-  -c      import_log.num_rows_processed will be updated after EVERY row!
+  -c      import_log.num_rows_processed will be updated after EVERY committed batch of rows!
           This allows dropmunch to recover from unexpected crashes to finish
           processing files, however it will slow down processing
+  --replace            reload data files which were already processed, replacing their rows.
+                       Rows are loaded into an unlogged staging table, and swapped in
+                       once the file is loaded, so readers never see a partly replaced file.
+                       With [archive] enabled, complete files were moved to the archive : those
+                       selected by --spec or --file are restored into the data directory first
+  --schedule=<policy>  order in which data files are processed :
+                       shortest, oldest or priority (from dropmunch.ini).
+                       Defaults to the [schedule] policy in dropmunch.ini, or shortest
+  --sink=<sink>        where data rows are written : postgres or sqlite.
+                       Defaults to the [sink] type in dropmunch.ini, or postgres
+  --stdin              load a data file streamed through stdin, rather than the data directory
+  --spec=<name>        spec of the streamed data file, or with --replace, of the data files to reload
+  --file=<file>        with --replace, the only data file to reload, e.g. testformat1_2007-10-01T13:47:12.345Z.txt
+  --timestamp=<timestamp>  timestamp of the streamed data file, e.g. 2007-10-01T13:47:12.345Z
 """
 
 import os
 import logging
-from dropmunch import munch_data, munch_spec
+import sys
+from dropmunch import munch_config, munch_data, munch_progress, munch_roots, munch_sink, munch_spec
 from docopt import docopt
 
 
@@ -26,20 +47,77 @@ if __name__ == '__main__':
 
 
 class MunchProcess:
-    def __init__(self, log_each_row=False):
+    def __init__(self, log_each_row=False, schedule_policy=None, sink_type=None, replace=False, replace_spec=None,
+                 replace_file=None, stream=False):
         self.working_directory = os.getcwd()
-        self.munch_spec = munch_spec.MunchSpec()
-        self.munch_data = munch_data.MunchData(log_each_row=log_each_row)
+        self.config = munch_config.MunchConfig()
+        # served from a daemon thread until the run ends - see munch_progress
+        self.progress = munch_progress.create_progress(self.config)
+        # drop roots configured in dropmunch.ini are served instead of the working directory. A
+        # streamed data file is loaded as if it had been dropped in the working directory
+        self.munch_roots = None if stream else \
+            munch_roots.create_roots(self.config, log_each_row, schedule_policy, None, replace, self.progress,
+                                     sink_type, replace_spec, replace_file)
+        self.munch_spec = None
+        self.munch_data = None
+        if self.munch_roots is None:
+            self.munch_spec = munch_spec.MunchSpec(config=self.config)
+            self.munch_data = munch_data.MunchData(log_each_row=log_each_row,
+                                                   config=self.config,
+                                                   schedule_policy=schedule_policy,
+                                                   sink=munch_sink.create_sink(self.config, sink_type),
+                                                   replace=replace,
+                                                   progress=self.progress,
+                                                   replace_spec=replace_spec,
+                                                   replace_file=replace_file)
 
     def get_pid_filename(self):
         return self.working_directory + '/.munching'
 
+    def is_pid_file_stale(self, pid_file):
+        """A pid file is stale when the process id it contains is no longer running"""
+        try:
+            with open(pid_file, 'r') as pid:
+                os.kill(int(pid.read().strip()), 0)
+        except ValueError:
+            # no process id - can't tell whether the process is still running
+            return False
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            # the process exists, but belongs to another user
+            return False
+        return False
+
+    def uses_claims(self):
+        return self.config.get('claim', 'enabled', False, bool)
+
     def process_spec_files(self):
-        self.munch_spec.process_spec_files()
+        if self.munch_roots is not None:
+            self.munch_roots.process_spec_files()
+        else:
+            self.munch_spec.process_spec_files()
 
     def process_data_files(self):
-        self.munch_data.process_data_files()
-        self.munch_data.cleanup()
+        try:
+            if self.munch_roots is not None:
+                self.munch_roots.process_data_files()
+                self.munch_roots.cleanup()
+            else:
+                self.munch_data.process_data_files()
+                self.munch_data.cleanup()
+        finally:
+            self.close_progress()
+
+    def process_stream(self, spec_name, timestamp):
+        try:
+            return self.munch_data.process_stream(sys.stdin.buffer, spec_name, timestamp)
+        finally:
+            self.close_progress()
+
+    def close_progress(self):
+        if self.progress is not None:
+            self.progress.close()
 
 def main():
     arguments = docopt(__doc__)
@@ -52,17 +130,40 @@ def main():
     log_each_row = False
 
     if arguments['-c']:
-        logging.info('import_log.num_rows_processed will be updated after EVERY row.')
+        logging.info('import_log.num_rows_processed will be updated after EVERY committed batch of rows.')
         log_each_row = True
 
-    munch_process = MunchProcess(log_each_row)
+    munch_process = MunchProcess(log_each_row, arguments['--schedule'], arguments['--sink'], arguments['--replace'],
+                                 arguments['--spec'], arguments['--file'], arguments['--stdin'])
+
+    if arguments['--stdin']:
+        # nothing is read from the data directory, so no pid file is needed
+        if not munch_process.process_stream(arguments['--spec'], arguments['--timestamp']):
+            raise SystemExit('Failed to load data file for spec {0} from stdin'.format(arguments['--spec']))
+        return
+
+    if munch_process.uses_claims():
+        logging.info('Claims are enabled - data files are coordinated through import_log, without a pid file')
+        try:
+            munch_process.process_spec_files()
+            munch_process.process_data_files()
+        except Exception as e:
+            logging.error('An error occurred while running the munch process : {0}'.format(e))
+        return
+
     pid_file = munch_process.get_pid_filename()
 
     if os.path.exists(pid_file):
-        raise FileExistsError('Found .munching (pid file). is a munch process already running? Aborting ...')
+        if munch_process.is_pid_file_stale(pid_file):
+            logging.warning('Removing stale .munching (pid file) left by a process which is no longer running')
+            os.remove(pid_file)
+        else:
+            raise FileExistsError('Found .munching (pid file). is a munch process already running? Aborting ...')
 
     try:
-        with open(pid_file, 'w'):
+        with open(pid_file, 'w') as pid:
+            pid.write(str(os.getpid()))
+            pid.flush()
             munch_process.process_spec_files()
             munch_process.process_data_files()
     except Exception as e:
@@ -0,0 +1,158 @@
+# dropmunch - live progress
+# - serves the progress of a munch run as JSON over HTTP, on a localhost port :
+# -   each data file being loaded : bytes and rows read, rows committed,
+#     rows per second, and an ETA
+# -   the whole run : files and bytes scheduled and done, rows committed,
+#     rows per second, and an ETA
+# - the total rows of a data file are known from its size and record width
+#   (Spec.total_col_width, plus its line terminator)
+# - loads aren't slowed down : the progress of a file is read from the counters
+#   DataFileLoad already keeps, without locks or database writes. They are only
+#   written by the thread loading the file, and read by the server thread. Counters
+#   of the whole run are written by every worker, under a lock
+import http.server
+import json
+import logging
+import threading
+import time
+
+default_host = '127.0.0.1'
+default_port = 8765
+
+
+def get_eta(remaining, rate):
+    if rate <= 0:
+        return None
+    return round(remaining / rate, 1)
+
+
+class FileProgress:
+    __slots__ = ('load', 'size', 'started')
+
+    def __init__(self, load, size, started):
+        self.load = load
+        self.size = size
+        self.started = started
+
+    def get_record_stride(self):
+        if self.load.record_stride is not None:
+            return self.load.record_stride
+        # read line by line - a valid row is a record followed by a newline
+        return self.load.spec.total_col_width + 1
+
+    def get_bytes_read(self):
+        bytes_read = (self.load.row_count - 1) * self.get_record_stride()
+        # the size of a streamed data file isn't known
+        return min(self.size, bytes_read) if self.size > 0 else bytes_read
+
+    def as_dict(self, now):
+        load = self.load
+        elapsed = max(now - self.started, 0.001)
+        rows_read = load.row_count - 1 - load.skip_rows
+        rows_total = self.size // max(1, self.get_record_stride()) if self.size > 0 else None
+        rows_per_second = rows_read / elapsed
+
+        return dict(file=load.file,
+                    spec=load.spec.name,
+                    bytes=self.size,
+                    bytes_read=self.get_bytes_read(),
+                    rows_total=rows_total,
+                    rows_read=load.row_count - 1,
+                    rows_committed=load.processed_row_count,
+                    rows_per_second=round(rows_per_second, 1),
+                    eta_seconds=None if rows_total is None else
+                    get_eta(max(0, rows_total - load.row_count + 1), rows_per_second))
+
+
+class ProgressRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps(self.server.progress.snapshot()).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.getLogger('MunchProgress').debug(format % args)
+
+
+class MunchProgress:
+    def __init__(self):
+        self.started = time.time()
+        # import_log id => FileProgress, for files being loaded
+        self.files = {}
+        self.files_total = 0
+        self.bytes_total = 0
+        self.files_done = 0
+        self.bytes_done = 0
+        self.rows_committed = 0
+        # guards the counters of the whole run
+        self.lock = threading.Lock()
+        self.server = None
+        self.log = logging.getLogger('MunchProgress')
+
+    def serve(self, host=default_host, port=default_port):
+        self.server = http.server.ThreadingHTTPServer((host, port), ProgressRequestHandler)
+        self.server.daemon_threads = True
+        self.server.progress = self
+        threading.Thread(target=self.server.serve_forever, name='progress', daemon=True).start()
+        self.log.info('Serving progress on http://{0}:{1}/'.format(host, self.server.server_port))
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def add_scheduled(self, file_count, size):
+        with self.lock:
+            self.files_total += file_count
+            self.bytes_total += size
+
+    def start_load(self, load, size):
+        self.files[load.import_log_id] = FileProgress(load, size, time.time())
+
+    def finish_load(self, load, done=True):
+        """Stops reporting a load. Unless it is done, e.g. it will be loaded again, it isn't counted"""
+        file_progress = self.files.pop(load.import_log_id, None)
+        if file_progress is not None and done:
+            with self.lock:
+                self.files_done += 1
+                self.bytes_done += file_progress.size
+                self.rows_committed += load.processed_row_count
+
+    def snapshot(self, now=None):
+        now = now if now is not None else time.time()
+        # list() copies the values without giving other threads a chance to change the dict
+        files = list(self.files.values())
+        with self.lock:
+            files_total, files_done = self.files_total, self.files_done
+            bytes_total, bytes_done, rows_committed = self.bytes_total, self.bytes_done, self.rows_committed
+        elapsed = max(now - self.started, 0.001)
+        bytes_done += sum(file_progress.get_bytes_read() for file_progress in files)
+        rows_committed += sum(file_progress.load.processed_row_count for file_progress in files)
+
+        return dict(files_total=files_total,
+                    files_done=files_done,
+                    bytes_total=bytes_total,
+                    bytes_done=bytes_done,
+                    rows_committed=rows_committed,
+                    rows_per_second=round(rows_committed / elapsed, 1),
+                    eta_seconds=get_eta(max(0, bytes_total - bytes_done), bytes_done / elapsed),
+                    files=[file_progress.as_dict(now) for file_progress in files])
+
+
+def create_progress(config):
+    """Returns a MunchProgress, serving on the [progress] port if it is enabled, otherwise None"""
+    if not config.get('progress', 'enabled', False, bool):
+        return None
+
+    progress = MunchProgress()
+    try:
+        progress.serve(config.get('progress', 'host', default_host),
+                       config.get('progress', 'port', default_port, int))
+    except OSError as e:
+        progress.log.error('Failed to serve progress. Progress will not be available. Error : {0}'.format(e))
+        return None
+    return progress
@@ -0,0 +1,146 @@
+# dropmunch - ingested data reader
+# - streams the rows ingested from data files back out of import_data_<spec>,
+#   for a single import_log row, or for all completed imports in a time range
+# - rows are fetched through a server-side (named) cursor, in batches of
+#   batch_size rows, so memory use doesn't grow with the size of the import
+# - each batch is either a list of row tuples, or a dict of column lists,
+#   with columns in spec order
+# - a MunchRead holds its connections until it is closed, e.g. by using it in a with
+#   statement. The module-level helpers share one MunchRead per database and sink
+import dataset
+import logging
+import sqlalchemy
+import threading
+from dropmunch import munch_config, munch_sink, munch_spec
+
+default_batch_size = 10000
+batch_layouts = ['rows', 'columns']
+
+# matches import_log.creation_date, e.g. 2007-10-01T13:47:12.345
+creation_date_format = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def format_creation_date(timestamp):
+    return timestamp.strftime(creation_date_format)[:-3]
+
+
+# (database url, sink type, sqlite path) => MunchRead shared by the module-level helpers
+readers = {}
+readers_lock = threading.Lock()
+
+
+def get_reader_key(config):
+    return (config.get('database', 'url', munch_config.default_database_url),
+            config.get('sink', 'type', munch_sink.default_sink_type),
+            config.get('sink', 'sqlite_path', munch_sink.default_sqlite_path))
+
+
+class MunchRead:
+    def __init__(self, config=None):
+        self.config = config if config is not None else munch_config.MunchConfig()
+        self.log = logging.getLogger('MunchRead')
+        self.db = dataset.connect(self.config.get('database', 'url', munch_config.default_database_url))
+        self.munch_spec = munch_spec.MunchSpec(None, self.config, db=self.db)
+
+        if self.config.get('sink', 'type', munch_sink.default_sink_type) == 'sqlite':
+            self.data_engine = sqlalchemy.create_engine('sqlite:///' + self.config.get('sink', 'sqlite_path',
+                                                                                       munch_sink.default_sqlite_path))
+        else:
+            self.data_engine = self.db.engine
+
+    def close(self):
+        if self.data_engine is not self.db.engine:
+            self.data_engine.dispose()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_import_log_ids(self, spec_name, start=None, end=None):
+        """Returns the ids of completed imports for a spec, with creation_date in [start, end)"""
+        import_format_row = self.db['import_format'].find_one(name=spec_name)
+
+        if import_format_row is None:
+            self.log.error('No spec was found in import_format for name {0}'.format(spec_name))
+            return []
+
+        import_log = self.db['import_log'].table
+        query = sqlalchemy.select(import_log.c.id) \
+            .where(import_log.c.import_format_id == import_format_row['id']) \
+            .where(import_log.c.import_status == 'complete') \
+            .order_by(import_log.c.creation_date)
+
+        # creation_date is stored as ISO8601 text, which sorts chronologically
+        if start is not None:
+            query = query.where(import_log.c.creation_date >= format_creation_date(start))
+        if end is not None:
+            query = query.where(import_log.c.creation_date < format_creation_date(end))
+
+        return [row['id'] for row in self.db.query(query)]
+
+    def iter_import(self, spec_name, import_log_id, batch_size=default_batch_size, layout='rows'):
+        """Yields batches of the rows ingested by one import_log row"""
+        return self.iter_import_log_ids(spec_name, [import_log_id], batch_size, layout)
+
+    def iter_imports(self, spec_name, start=None, end=None, batch_size=default_batch_size, layout='rows'):
+        """Yields batches of the rows ingested by all completed imports of a spec with
+           data file timestamps in [start, end). Either bound may be None"""
+        return self.iter_import_log_ids(spec_name, self.get_import_log_ids(spec_name, start, end),
+                                        batch_size, layout)
+
+    def iter_import_log_ids(self, spec_name, import_log_ids, batch_size=default_batch_size, layout='rows'):
+        if layout not in batch_layouts:
+            raise ValueError('batch layout {0} is not one of {1}'.format(layout, batch_layouts))
+
+        spec = self.munch_spec.load_spec_from_db(spec_name)
+        if spec is None:
+            raise ValueError('No spec was found for name {0}'.format(spec_name))
+        if len(import_log_ids) == 0:
+            return
+
+        column_names = [spec_column.name for spec_column in spec.columns]
+        spec_table = sqlalchemy.Table(munch_spec.get_spec_table_name(spec_name), sqlalchemy.MetaData(),
+                                      autoload_with=self.data_engine)
+        query = sqlalchemy.select(*[spec_table.c[name] for name in column_names]) \
+            .where(spec_table.c.import_log_id.in_(import_log_ids)) \
+            .order_by(spec_table.c.import_log_id, spec_table.c.id)
+
+        # stream_results makes postgres drivers use a named, server-side cursor
+        with self.data_engine.connect().execution_options(stream_results=True,
+                                                          yield_per=batch_size) as connection:
+            result = connection.execute(query)
+            for partition in result.partitions(batch_size):
+                if layout == 'rows':
+                    yield [tuple(row) for row in partition]
+                else:
+                    yield dict(zip(column_names, (list(column) for column in zip(*partition))))
+
+
+def get_reader(config=None):
+    """Returns the MunchRead shared by calls with the same database and sink"""
+    config = config if config is not None else munch_config.MunchConfig()
+    key = get_reader_key(config)
+    with readers_lock:
+        reader = readers.get(key)
+        if reader is None:
+            reader = readers[key] = MunchRead(config)
+        return reader
+
+
+def close_readers():
+    with readers_lock:
+        closing = list(readers.values())
+        readers.clear()
+    for reader in closing:
+        reader.close()
+
+
+def iter_import(spec_name, import_log_id, batch_size=default_batch_size, layout='rows', config=None):
+    return get_reader(config).iter_import(spec_name, import_log_id, batch_size, layout)
+
+
+def iter_imports(spec_name, start=None, end=None, batch_size=default_batch_size, layout='rows', config=None):
+    return get_reader(config).iter_imports(spec_name, start, end, batch_size, layout)
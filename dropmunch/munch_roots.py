@@ -0,0 +1,173 @@
+# dropmunch - drop roots
+# - serves several drop directories ("roots") from one process. Each root is a
+#   [root:<name>] section of dropmunch.ini :
+# -   directory : the root, holding its own specs and data directories
+# -   namespace : prefixed to the names of the root's specs, so that roots may use
+#                 the same spec names. Defaults to no prefix
+# -   priority  : default priority of the root's specs, for the priority schedule policy
+# - data files of every root are scheduled together, and loaded by one pool of
+#   [roots] workers threads. Roots share one catalog database engine, and so one
+#   connection pool, and one progress endpoint. Each worker has its own sink, and
+#   postgres sinks share one engine - dataset gives each thread its own connection
+# - the sqlite sink has a single writer, so it is used by a single worker. So is a
+#   sink given to MunchRoots, since it can't be shared between threads
+# - with [tune] enabled, the number of busy workers follows commit latency, between
+#   min_workers and max_workers - see munch_tune
+import concurrent.futures
+import dataset
+import logging
+import os
+from dropmunch import munch_config, munch_data, munch_schedule, munch_sink, munch_spec, munch_tune
+
+root_section_prefix = 'root:'
+default_workers = 4
+
+
+def get_root_names(config):
+    return [section[len(root_section_prefix):] for section in config.parser.sections()
+            if section.startswith(root_section_prefix)]
+
+
+class MunchRoot:
+    def __init__(self, name, munch_spec, munch_data):
+        self.name = name
+        self.munch_spec = munch_spec
+        self.munch_data = munch_data
+
+
+class MunchRoots:
+    def __init__(self, config, log_each_row=False, schedule_policy=None, sink=None, replace=False, progress=None,
+                 sink_type=None, replace_spec=None, replace_file=None):
+        self.config = config
+        self.log = logging.getLogger('MunchRoots')
+        self.schedule_policy = schedule_policy if schedule_policy is not None else \
+            self.config.get('schedule', 'policy', munch_schedule.default_policy)
+        self.db = dataset.connect(self.config.get('database', 'url', munch_config.default_database_url))
+        self.workers = max(1, self.config.get('roots', 'workers', default_workers, int))
+        sink_type = sink_type if sink_type is not None else \
+            self.config.get('sink', 'type', munch_sink.default_sink_type)
+        # the engine of the workers' postgres sinks - separate from self.db, so that import_log
+        # updates aren't part of a sink's transaction
+        self.sink_db = None
+        if sink is None and sink_type != 'sqlite':
+            if sink_type == 'postgres':
+                self.sink_db = dataset.connect(self.config.get('database', 'url', munch_config.default_database_url))
+            self.sink = munch_sink.ThreadLocalSink(lambda: munch_sink.create_sink(self.config, sink_type,
+                                                                                  self.sink_db))
+        else:
+            self.sink = sink if sink is not None else munch_sink.create_sink(self.config, sink_type)
+            if self.workers > 1:
+                self.log.warn('The sink can\'t be shared between threads - using a single worker')
+                self.workers = 1
+
+        self.tuner = munch_tune.create_tuner(self.config,
+                                             max(1, self.config.get('data', 'batch_size',
+                                                                    munch_data.default_batch_size, int)),
+                                             self.workers)
+        if self.tuner is not None and not isinstance(self.sink, munch_sink.ThreadLocalSink):
+            self.tuner.min_workers = self.tuner.max_workers = self.tuner.workers = 1
+
+        self.roots = []
+        for name in get_root_names(self.config):
+            section = root_section_prefix + name
+            directory = self.config.get(section, 'directory')
+            if directory is None:
+                self.log.error('Drop root {0} has no directory. It will be skipped'.format(name))
+                continue
+
+            directory = os.path.abspath(directory)
+            namespace = self.config.get(section, 'namespace', '')
+            self.roots.append(MunchRoot(
+                name,
+                munch_spec.MunchSpec(directory + munch_spec.spec_directory, self.config, namespace, self.db),
+                munch_data.MunchData(log_each_row=log_each_row,
+                                     config=self.config,
+                                     schedule_policy=self.schedule_policy,
+                                     sink=self.sink,
+                                     replace=replace,
+                                     root_directory=directory,
+                                     namespace=namespace,
+                                     priority=self.config.get(section, 'priority', None, int),
+                                     db=self.db,
+                                     progress=progress,
+                                     tuner=self.tuner,
+                                     replace_spec=replace_spec,
+                                     replace_file=replace_file)))
+
+    def process_spec_files(self):
+        for root in self.roots:
+            self.log.info('Processing spec files of drop root {0}'.format(root.name))
+            root.munch_spec.process_spec_files()
+
+    def schedule_data_files(self):
+        scheduler = munch_schedule.MunchScheduler(self.schedule_policy,
+                                                  max_files_per_spec=self.config.get('schedule', 'max_files_per_spec',
+                                                                                     munch_schedule.default_max_files_per_spec,
+                                                                                     int))
+        for root in self.roots:
+            root.munch_data.schedule_data_files(scheduler)
+
+        self.log.info('Scheduled {0} data files from {1} drop roots'.format(scheduler.pending_count(),
+                                                                           len(self.roots)))
+        return scheduler
+
+    def process_data_files(self):
+        """Loads the data files of every root on the worker pool. The scheduler is only used
+           from this thread - files are taken as workers become free, and marked done here"""
+        try:
+            scheduler = self.schedule_data_files()
+            running = {}
+
+            with concurrent.futures.ThreadPoolExecutor(self.get_max_workers(), thread_name_prefix='munch') as pool:
+                while True:
+                    while len(running) < self.get_workers():
+                        scheduled_file = scheduler.take()
+                        if scheduled_file is None:
+                            break
+                        # small files of a spec are coalesced, if the root's config allows it
+                        group = scheduled_file.source.take_group(scheduler, scheduled_file)
+                        running[pool.submit(scheduled_file.source.process_group, group)] = group
+
+                    if len(running) == 0:
+                        break
+
+                    done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        group = running.pop(future)
+                        for scheduled_file in group:
+                            scheduler.done(scheduled_file)
+                        if future.exception() is not None:
+                            self.log.error('An error occurred while processing file {0}. Error : {1}'
+                                           .format(group[0].file, future.exception()))
+        except Exception as e:
+            self.log.error('An error occurred while processing data files. Error : {0}'.format(e))
+        finally:
+            self.sink.close()
+
+    def get_workers(self):
+        """Returns the number of data files to load at once"""
+        return self.tuner.workers if self.tuner is not None else self.workers
+
+    def get_max_workers(self):
+        return self.tuner.max_workers if self.tuner is not None else self.workers
+
+    def cleanup(self):
+        for root in self.roots:
+            root.munch_data.cleanup()
+        if self.sink_db is not None:
+            self.sink_db.close()
+
+    @property
+    def processed_count(self):
+        return sum(root.munch_data.processed_count for root in self.roots)
+
+
+def create_roots(config, log_each_row=False, schedule_policy=None, sink=None, replace=False, progress=None,
+                 sink_type=None, replace_spec=None, replace_file=None):
+    """Returns MunchRoots if drop roots are configured in [root:<name>] sections, otherwise None.
+       Unless a sink is given, each worker creates its own sink of sink_type"""
+    if len(get_root_names(config)) == 0:
+        return None
+
+    return MunchRoots(config, log_each_row, schedule_policy, sink, replace, progress, sink_type,
+                      replace_spec, replace_file)
@@ -0,0 +1,116 @@
+# dropmunch - data file scheduler
+# - orders unprocessed data files according to a scheduling policy :
+# -   shortest : smallest data file first. Named pipes have no size, so they come
+#                after files of any size
+# -   oldest   : oldest data file timestamp first
+# -   priority : highest spec priority first (from config), then oldest
+# - data files of the same spec are always released in timestamp order
+# - limits the number of data files per spec which may be in progress at once
+import bisect
+import logging
+
+schedule_policies = ['shortest', 'oldest', 'priority']
+default_policy = 'shortest'
+default_max_files_per_spec = 1
+default_priority = 0
+
+
+class ScheduledFile:
+    def __init__(self, file, datafile_spec, import_log_row, size, source=None):
+        self.file = file
+        self.datafile_spec = datafile_spec
+        self.import_log_row = import_log_row
+        # None for a named pipe, whose size isn't known
+        self.size = size
+        # the MunchData which loads the file, when files of several drop roots are scheduled together
+        self.source = source
+
+    @property
+    def spec_name(self):
+        return self.datafile_spec.spec.name
+
+
+def get_timestamp(scheduled_file):
+    return scheduled_file.datafile_spec.timestamp
+
+
+class MunchScheduler:
+    def __init__(self, policy=default_policy, priorities=None,
+                 max_files_per_spec=default_max_files_per_spec):
+        if policy not in schedule_policies:
+            raise ValueError('schedule policy {0} is not one of {1}'.format(policy, schedule_policies))
+
+        self.policy = policy
+        self.priorities = priorities if priorities is not None else {}
+        self.max_files_per_spec = max(1, max_files_per_spec)
+        self.log = logging.getLogger('MunchScheduler')
+        # spec name => list of ScheduledFile, kept in timestamp order
+        self.pending = {}
+        # spec name => number of files taken but not yet done
+        self.in_progress = {}
+
+    def add(self, scheduled_file):
+        queue = self.pending.setdefault(scheduled_file.spec_name, [])
+        # inserted after any files with the same timestamp, rather than sorting the queue on every add
+        bisect.insort(queue, scheduled_file, key=get_timestamp)
+
+    def pending_count(self):
+        return sum(len(queue) for queue in self.pending.values())
+
+    def sort_key(self, scheduled_file):
+        timestamp = scheduled_file.datafile_spec.timestamp
+        # files of unknown size rank after files of any size
+        size = (scheduled_file.size is None, scheduled_file.size or 0)
+
+        if self.policy == 'shortest':
+            return size, timestamp
+        elif self.policy == 'oldest':
+            return timestamp, size
+        else:
+            return (-self.priorities.get(scheduled_file.spec_name, default_priority),
+                    timestamp, size)
+
+    def take(self):
+        """Returns the next data file to process, or None if no spec has
+           a data file available within its in-progress limit.
+
+           Only the oldest pending file of each spec is eligible, so that
+           strict timestamp order is kept within a spec"""
+        candidates = [queue[0] for spec_name, queue in self.pending.items()
+                      if queue and self.in_progress.get(spec_name, 0) < self.max_files_per_spec]
+
+        if len(candidates) == 0:
+            return None
+
+        scheduled_file = min(candidates, key=self.sort_key)
+        self.pending[scheduled_file.spec_name].pop(0)
+        self.in_progress[scheduled_file.spec_name] = self.in_progress.get(scheduled_file.spec_name, 0) + 1
+        self.log.debug('Scheduled file {0} ({1} bytes) using policy {2}'
+                       .format(scheduled_file.file, scheduled_file.size, self.policy))
+        return scheduled_file
+
+    def take_following(self, scheduled_file, max_files, max_size):
+        """Takes the next pending files of the same spec as scheduled_file, in timestamp order,
+           for as long as they are smaller than max_size bytes - so that small files may be
+           loaded together. Each of them must be marked done"""
+        queue = self.pending.get(scheduled_file.spec_name, [])
+        following = []
+
+        while queue and len(following) < max_files and queue[0].size is not None and queue[0].size < max_size:
+            following.append(queue.pop(0))
+
+        self.in_progress[scheduled_file.spec_name] = self.in_progress.get(scheduled_file.spec_name, 0) + len(following)
+        return following
+
+    def done(self, scheduled_file):
+        self.in_progress[scheduled_file.spec_name] -= 1
+
+    def __iter__(self):
+        """Sequential use - each file is marked done before the next one is taken"""
+        scheduled_file = self.take()
+        while scheduled_file is not None:
+            try:
+                yield scheduled_file
+            finally:
+                self.done(scheduled_file)
+            scheduled_file = self.take()
@@ -0,0 +1,734 @@
+# dropmunch - output sinks
+# - a sink persists the typed rows parsed from data files :
+# -   open_table  : prepares the import_data_<spec> table for a spec. A large load
+#                   into an empty table is a bulk load - its secondary indexes and
+#                   foreign key are dropped, and built once the load is finalized
+# -   write_batch : writes a batch of rows, each row being a sequence of
+#                   import_log_id followed by the spec column values. A failed
+#                   batch is rolled back, and its error kept in last_error.
+#                   is_data_error tells rows the database rejected, e.g. a
+#                   constraint violation, from a failure of the database itself
+#                   Rows of a spec with key columns are upserted : the batch is
+#                   written to a temporary table, and merged into the spec table
+#                   with one INSERT ... ON CONFLICT (keys) DO UPDATE, on the
+#                   spec table's unique key index
+# -   fence       : makes the next commit depend on a node still claiming an
+#                   import_log row - see munch_claim
+# -   commit      : commits the rows written so far, as a checkpoint
+# -   finalize    : completes loading a data file into the spec table
+# -   close       : releases the sink at the end of a run
+# -   delete_import : deletes the rows loaded for an import_log row
+# -   open_staging  : redirects the rows written for a spec into a staging table,
+#                     to replace the rows previously loaded for an import_log row
+# -   swap_staging  : replaces those rows with the staged rows, in one transaction
+# -   drop_staging  : discards the staged rows, leaving the spec table unchanged
+# - postgres : batched inserts into the dropmunch database, either through dataset, or
+#              with insert_mode = prepared, through multi-row INSERT statements built once
+#              per table, executed in pages of rows on the DB-API cursor. Neither uses COPY,
+#              so both work behind poolers and proxies which don't allow it
+# - sqlite   : executemany into a local SQLite database in WAL mode,
+#              for loads and benchmarks on machines without postgres
+# - a sink keeps per-spec state, e.g. the staging table rows are written to, so it
+#   can't be shared between threads. ThreadLocalSink gives each thread its own sink
+import dataset
+import datetime
+import decimal
+import itertools
+import logging
+import sqlalchemy
+import sqlite3
+import threading
+from dropmunch import munch_claim, munch_config, munch_spec
+
+sink_types = ['postgres', 'sqlite']
+default_sink_type = 'postgres'
+default_sqlite_path = 'dropmunch.sqlite'
+
+# expected rows in a data file at which a load into an empty table defers index builds
+default_bulk_load_min_rows = 1000000
+
+insert_modes = ['dataset', 'prepared']
+default_insert_mode = 'dataset'
+# rows per multi-row INSERT statement, in prepared insert mode
+default_insert_page_size = 1000
+# postgres allows at most 65535 parameters in a statement
+max_statement_parameters = 65535
+
+sqlite_types = {
+    'TEXT': 'TEXT',
+    'BOOLEAN': 'BOOLEAN',
+    'INTEGER': 'INTEGER',
+    'DECIMAL': 'NUMERIC',
+    'DATE': 'DATE',
+    'TIMESTAMP': 'TIMESTAMP',
+    'FLOAT': 'REAL',
+}
+
+# sqlite has no decimal or date types - decimals are bound as text, which NUMERIC
+# columns store as numbers, and dates and timestamps as ISO text, which sorts in order
+sqlite3.register_adapter(decimal.Decimal, str)
+sqlite3.register_adapter(datetime.date, datetime.date.isoformat)
+sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(' '))
+
+
+# DB-API exceptions raised for rows the database rejects. psycopg, sqlite3 and SQLAlchemy
+# all name them after the DB-API classes
+data_error_names = ('IntegrityError', 'DataError')
+
+
+def is_data_error(error):
+    """Returns True if a sink error was caused by the rows written, rather than e.g. a dropped connection"""
+    return isinstance(error, OverflowError) or \
+        any(cls.__name__ in data_error_names for cls in type(error).__mro__)
+
+
+def get_column_names(spec):
+    return ['import_log_id'] + [spec_column.name for spec_column in spec.columns]
+
+
+class PreparedInsert:
+    """A multi-row INSERT into one table, built once, and executed for pages of rows"""
+    def __init__(self, table_name, column_names, page_size=default_insert_page_size, prepare=False):
+        self.page_size = max(1, min(page_size, max_statement_parameters // len(column_names)))
+        self.row_sql = '({0})'.format(', '.join('%s' for _ in column_names))
+        self.prefix = 'INSERT INTO "{0}" ({1}) VALUES '.format(table_name,
+                                                               ', '.join('"{0}"'.format(name)
+                                                                         for name in column_names))
+        self.page_sql = self.get_sql(self.page_size)
+        # psycopg 3 can prepare the statement on the server, so it is only planned once
+        self.execute_options = dict(prepare=True) if prepare else {}
+
+    def get_sql(self, row_count):
+        return self.prefix + ', '.join(itertools.repeat(self.row_sql, row_count))
+
+    def execute(self, cursor, rows):
+        rows = iter(rows)
+        while True:
+            page = list(itertools.islice(rows, self.page_size))
+            if len(page) == 0:
+                return
+            elif len(page) == self.page_size:
+                cursor.execute(self.page_sql, list(itertools.chain.from_iterable(page)), **self.execute_options)
+            else:
+                # the last, partial page of a batch
+                cursor.execute(self.get_sql(len(page)), list(itertools.chain.from_iterable(page)))
+
+
+class MunchSink:
+    def __init__(self, config=None):
+        self.config = config if config is not None else munch_config.MunchConfig()
+        self.log = logging.getLogger('MunchSink')
+        self.bulk_load_min_rows = self.config.get('data', 'bulk_load_min_rows', default_bulk_load_min_rows, int)
+        # names of specs whose index builds are deferred until finalize
+        self.bulk_loads = set()
+        # names of specs whose rows are written to a staging table
+        self.staged = set()
+        self.last_error = None
+
+    def open_table(self, spec, expected_row_count=0):
+        raise NotImplementedError
+
+    def write_batch(self, spec, rows):
+        raise NotImplementedError
+
+    def commit(self):
+        raise NotImplementedError
+
+    def fence(self, import_log_id, node_id):
+        """Checks that node_id still claims import_log_id, within the transaction the next commit
+           ends. Raises ClaimLost if it doesn't, after rolling back. Returns False if it can't be checked"""
+        raise NotImplementedError
+
+    def rollback(self):
+        raise NotImplementedError
+
+    def finalize(self, spec):
+        return self.commit()
+
+    def close(self):
+        pass
+
+    def delete_import(self, spec, import_log_id):
+        raise NotImplementedError
+
+    def open_staging(self, spec, import_log_id):
+        raise NotImplementedError
+
+    def swap_staging(self, spec, import_log_id):
+        raise NotImplementedError
+
+    def drop_staging(self, spec, import_log_id):
+        raise NotImplementedError
+
+    def get_staging_table_name(self, spec, import_log_id):
+        return '{0}_staging_{1}'.format(munch_spec.get_spec_table_name(spec.name), import_log_id)
+
+    def get_upsert_table_name(self, spec):
+        return '{0}_upsert'.format(munch_spec.get_spec_table_name(spec.name))
+
+    def is_upsert(self, spec):
+        """Rows of a spec with key columns are upserted, unless they are staged - staged rows
+           are upserted once they are swapped in"""
+        return len(spec.key_columns) > 0 and spec.name not in self.staged
+
+    def get_merge_statement(self, spec, source_table_name):
+        """Returns an INSERT of the rows of source_table_name into the spec table, where a row
+           with the same keys as a stored row replaces it. When rows of the source share keys,
+           the last one wins"""
+        column_names = get_column_names(spec)
+        key_names = [column.name for column in spec.key_columns]
+        columns = ', '.join('"{0}"'.format(name) for name in column_names)
+        keys = ', '.join('"{0}"'.format(name) for name in key_names)
+
+        return 'INSERT INTO "{0}" ({1}) {2} ON CONFLICT ({3}) DO UPDATE SET {4}'.format(
+            munch_spec.get_spec_table_name(spec.name),
+            columns,
+            self.get_merge_select(columns, keys, source_table_name),
+            keys,
+            ', '.join('"{0}" = excluded."{0}"'.format(name) for name in column_names if name not in key_names))
+
+    def get_merge_select(self, columns, keys, source_table_name):
+        raise NotImplementedError
+
+    def get_indexes(self, spec):
+        index_columns = self.config.spec_get(spec.name, 'index_columns', '')
+        return munch_spec.get_spec_indexes(spec, [column.strip() for column in index_columns.split(',')
+                                                  if column.strip()])
+
+    def get_index_statements(self, spec, concurrently=False):
+        return ['CREATE INDEX {0}IF NOT EXISTS "{1}" ON "{2}" ({3})'.format(
+                    'CONCURRENTLY ' if concurrently else '',
+                    index_name,
+                    munch_spec.get_spec_table_name(spec.name),
+                    ', '.join('"{0}"'.format(column) for column in columns))
+                for index_name, columns in self.get_indexes(spec)]
+
+    def get_drop_index_statements(self, spec):
+        return ['DROP INDEX IF EXISTS "{0}"'.format(index_name) for index_name, _ in self.get_indexes(spec)]
+
+    def is_bulk_load(self, spec, expected_row_count):
+        return expected_row_count >= self.bulk_load_min_rows and self.is_table_empty(spec)
+
+    def prepare_indexes(self, spec, expected_row_count):
+        """Drops secondary indexes ahead of a bulk load, otherwise makes sure they exist"""
+        if self.is_bulk_load(spec, expected_row_count):
+            self.log.info('Bulk loading about {0} rows into empty table {1} - index builds are deferred'
+                          .format(expected_row_count, munch_spec.get_spec_table_name(spec.name)))
+            self.drop_indexes(spec)
+            self.bulk_loads.add(spec.name)
+        elif spec.name not in self.bulk_loads:
+            self.create_indexes(spec)
+
+    def build_deferred_indexes(self, spec):
+        if spec.name in self.bulk_loads:
+            self.bulk_loads.discard(spec.name)
+            self.log.info('Building deferred indexes on {0}'.format(munch_spec.get_spec_table_name(spec.name)))
+            self.create_indexes(spec, concurrently=True)
+
+    def is_table_empty(self, spec):
+        raise NotImplementedError
+
+    def create_indexes(self, spec, concurrently=False):
+        raise NotImplementedError
+
+    def drop_indexes(self, spec):
+        raise NotImplementedError
+
+
+class PostgresSink(MunchSink):
+    def __init__(self, database_url, config=None, db=None):
+        MunchSink.__init__(self, config)
+        # a separate connection from MunchData.db, so that import_log updates
+        # aren't part of the sink's transaction. Sinks of several threads may share
+        # a db - it is then closed by its owner, rather than by each sink
+        self.owns_db = db is None
+        self.db = db if db is not None else dataset.connect(database_url)
+        self.tables = {}
+        # specs whose indexes are known to exist during this run
+        self.indexed = set()
+        self.insert_mode = self.config.get('sink', 'insert_mode', default_insert_mode)
+        if self.insert_mode not in insert_modes:
+            raise ValueError('insert mode {0} is not one of {1}'.format(self.insert_mode, insert_modes))
+        self.insert_page_size = self.config.get('sink', 'insert_page_size', default_insert_page_size, int)
+        # (table name, spec version) => PreparedInsert
+        self.inserts = {}
+
+    def open_table(self, spec, expected_row_count=0):
+        spec_table_name = munch_spec.get_spec_table_name(spec.name)
+        try:
+            if not self.db.has_table(spec_table_name):
+                self.log.info('Spec table {0} doesn\'t exist yet. We\'ll attempt to create it.'.format(spec_table_name))
+                with self.db as transaction:
+                    munch_spec.create_spec_table(transaction, spec)
+
+            self.tables[spec.name] = self.db.load_table(spec_table_name)
+            # columns of a later spec version, if the table was created before it
+            munch_spec.add_spec_columns(self.tables[spec.name], spec)
+            self.prepare_indexes(spec, expected_row_count)
+            self.db.begin()
+            return True
+        except Exception as e:
+            self.log.error('Failed to open spec table {0}. Error : {1}'.format(spec_table_name, e))
+            return False
+
+    def get_prepared_insert(self, spec, table_name):
+        # versions of a spec insert different columns into the same table
+        prepared_insert = self.inserts.get((table_name, spec.version))
+        if prepared_insert is None:
+            prepared_insert = PreparedInsert(table_name, get_column_names(spec), self.insert_page_size,
+                                             prepare=self.db.engine.dialect.driver == 'psycopg')
+            self.inserts[(table_name, spec.version)] = prepared_insert
+        return prepared_insert
+
+    def write_batch(self, spec, rows):
+        column_names = get_column_names(spec)
+        try:
+            table = self.tables[spec.name]
+            if self.is_upsert(spec):
+                self.upsert_batch(spec, rows)
+            elif self.insert_mode == 'prepared':
+                # the raw cursor shares the connection, and so the transaction, used by dataset
+                cursor = self.db.executable.connection.cursor()
+                try:
+                    self.get_prepared_insert(spec, table.name).execute(cursor, rows)
+                finally:
+                    cursor.close()
+            else:
+                table.insert_many([dict(zip(column_names, row)) for row in rows],
+                                  chunk_size=len(rows), ensure=False)
+            return True
+        except Exception as e:
+            # the caller isolates the rejected rows - see MunchData.write_batch
+            self.log.warn('An error occurred while persisting {0} rows into {1}. Error : {2}'
+                          .format(len(rows), munch_spec.get_spec_table_name(spec.name), e))
+            self.last_error = e
+            self.rollback()
+            return False
+
+    def upsert_batch(self, spec, rows):
+        upsert_table_name = self.get_upsert_table_name(spec)
+        # a temporary table lasts as long as the session, and isn't visible to other sessions
+        self.db.query('CREATE TEMPORARY TABLE IF NOT EXISTS "{0}" (LIKE "{1}" INCLUDING DEFAULTS) '
+                      'ON COMMIT DELETE ROWS'.format(upsert_table_name, munch_spec.get_spec_table_name(spec.name)))
+        cursor = self.db.executable.connection.cursor()
+        try:
+            self.get_prepared_insert(spec, upsert_table_name).execute(cursor, rows)
+        finally:
+            cursor.close()
+        self.db.query(self.get_merge_statement(spec, upsert_table_name))
+        # several batches may be merged before a commit
+        self.db.query('DELETE FROM "{0}"'.format(upsert_table_name))
+
+    def get_merge_select(self, columns, keys, source_table_name):
+        # a row can only be updated once per statement - the row written last for each key is kept
+        return 'SELECT DISTINCT ON ({0}) {1} FROM "{2}" ORDER BY {0}, "id" DESC'.format(keys, columns,
+                                                                                     source_table_name)
+
+    def commit(self):
+        try:
+            self.db.commit()
+            self.db.begin()
+            return True
+        except Exception as e:
+            self.log.warn('An error occurred while committing rows. Error : {0}'.format(e))
+            self.last_error = e
+            self.rollback()
+            return False
+
+    def fence(self, import_log_id, node_id):
+        # the lock is held until the commit, so the claim can't be taken over before it
+        sql = munch_claim.fence_sql + (' FOR SHARE' if self.is_postgres() else '')
+        try:
+            claimed = len(list(self.db.query(sql, import_log_id=import_log_id, node_id=node_id))) > 0
+        except Exception as e:
+            self.log.warn('An error occurred while checking the claim on import_log id {0}. Error : {1}'
+                          .format(import_log_id, e))
+            self.last_error = e
+            self.rollback()
+            return False
+
+        if not claimed:
+            self.rollback()
+            raise munch_claim.ClaimLost('import_log id {0} is no longer claimed by node {1}'
+                                        .format(import_log_id, node_id))
+        return True
+
+    def rollback(self):
+        try:
+            self.db.rollback()
+        finally:
+            self.db.begin()
+
+    def finalize(self, spec):
+        try:
+            self.db.commit()
+        except Exception as e:
+            self.log.error('An error occurred while committing rows into {0}. Error : {1}'
+                           .format(munch_spec.get_spec_table_name(spec.name), e))
+            self.db.rollback()
+            return False
+
+        try:
+            self.build_deferred_indexes(spec)
+            return True
+        except Exception as e:
+            self.log.error('Failed to build indexes on {0}. Error : {1}'
+                           .format(munch_spec.get_spec_table_name(spec.name), e))
+            return False
+
+    def close(self):
+        if self.owns_db:
+            self.db.close()
+
+    def delete_import(self, spec, import_log_id):
+        spec_table_name = munch_spec.get_spec_table_name(spec.name)
+        try:
+            if self.db.has_table(spec_table_name):
+                with self.db as transaction:
+                    transaction[spec_table_name].delete(import_log_id=import_log_id)
+            return True
+        except Exception as e:
+            self.log.error('Failed to delete rows for import_log id {0} from {1}. Error : {2}'
+                           .format(import_log_id, spec_table_name, e))
+            return False
+
+    def open_staging(self, spec, import_log_id):
+        spec_table_name = munch_spec.get_spec_table_name(spec.name)
+        staging_table_name = self.get_staging_table_name(spec, import_log_id)
+        try:
+            # an unlogged table skips the WAL. It shares the spec table's id sequence,
+            # so that staged rows keep their order once swapped in
+            self.db.query('DROP TABLE IF EXISTS "{0}"'.format(staging_table_name))
+            self.db.query('CREATE {0}TABLE "{1}" (LIKE "{2}" INCLUDING DEFAULTS)'.format(
+                'UNLOGGED ' if self.is_postgres() else '', staging_table_name, spec_table_name))
+            self.db.commit()
+            self.db.begin()
+            self.tables[spec.name] = self.db.load_table(staging_table_name)
+            self.staged.add(spec.name)
+            return True
+        except Exception as e:
+            self.log.error('Failed to create staging table {0}. Error : {1}'.format(staging_table_name, e))
+            self.rollback()
+            return False
+
+    def swap_staging(self, spec, import_log_id):
+        spec_table_name = munch_spec.get_spec_table_name(spec.name)
+        staging_table_name = self.get_staging_table_name(spec, import_log_id)
+        try:
+            # readers see either the previous rows or the staged rows, never a mix
+            self.db.query('DELETE FROM "{0}" WHERE import_log_id = {1:d}'.format(spec_table_name, import_log_id))
+            if spec.key_columns:
+                self.db.query(self.get_merge_statement(spec, staging_table_name))
+            else:
+                self.db.query('INSERT INTO "{0}" SELECT * FROM "{1}"'.format(spec_table_name, staging_table_name))
+            self.db.query('DROP TABLE "{0}"'.format(staging_table_name))
+            self.db.commit()
+            self.db.begin()
+            return True
+        except Exception as e:
+            self.log.error('Failed to swap staging table {0} into {1}. Error : {2}'
+                           .format(staging_table_name, spec_table_name, e))
+            self.last_error = e
+            self.rollback()
+            return False
+        finally:
+            self.staged.discard(spec.name)
+            self.tables[spec.name] = self.db.load_table(spec_table_name)
+
+    def drop_staging(self, spec, import_log_id):
+        staging_table_name = self.get_staging_table_name(spec, import_log_id)
+        # a transaction is only begun again if the load's transaction wasn't finalized yet -
+        # otherwise the next load's commits would be nested in it, and never persisted
+        in_transaction = self.db.in_transaction
+        try:
+            if in_transaction:
+                self.db.rollback()
+            self.db.begin()
+            self.db.query('DROP TABLE IF EXISTS "{0}"'.format(staging_table_name))
+            self.db.commit()
+        except Exception as e:
+            self.log.warn('Failed to drop staging table {0}. Error : {1}'.format(staging_table_name, e))
+            self.db.rollback()
+        finally:
+            if in_transaction:
+                self.db.begin()
+            self.staged.discard(spec.name)
+            self.tables[spec.name] = self.db.load_table(munch_spec.get_spec_table_name(spec.name))
+
+    def is_postgres(self):
+        return self.db.engine.dialect.name == 'postgresql'
+
+    def get_foreign_key_name(self, spec):
+        return 'fk_{0}_import_log'.format(munch_spec.get_spec_table_name(spec.name))
+
+    def execute_ddl(self, statements, autocommit=False):
+        if autocommit:
+            # CREATE INDEX CONCURRENTLY can't run inside a transaction
+            with self.db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                for statement in statements:
+                    connection.execute(sqlalchemy.text(statement))
+        else:
+            with self.db as transaction:
+                for statement in statements:
+                    transaction.query(statement)
+
+    def is_table_empty(self, spec):
+        rows = self.db.query('SELECT 1 FROM "{0}" LIMIT 1'.format(munch_spec.get_spec_table_name(spec.name)))
+        return next(iter(rows), None) is None
+
+    def create_indexes(self, spec, concurrently=False):
+        if spec.name in self.indexed:
+            return
+
+        spec_table_name = munch_spec.get_spec_table_name(spec.name)
+        concurrently = concurrently and self.is_postgres()
+        self.execute_ddl(self.get_index_statements(spec, concurrently), autocommit=concurrently)
+
+        if self.is_postgres():
+            foreign_key_name = self.get_foreign_key_name(spec)
+            foreign_keys = [foreign_key['name'] for foreign_key in self.db.inspect.get_foreign_keys(spec_table_name)]
+            if foreign_key_name not in foreign_keys:
+                # validating separately only takes a SHARE UPDATE EXCLUSIVE lock,
+                # so reads and writes can continue while existing rows are checked
+                self.execute_ddl(['ALTER TABLE "{0}" ADD CONSTRAINT "{1}" FOREIGN KEY ("import_log_id") '
+                                  'REFERENCES import_log (id) NOT VALID'.format(spec_table_name, foreign_key_name)])
+                self.execute_ddl(['ALTER TABLE "{0}" VALIDATE CONSTRAINT "{1}"'.format(spec_table_name,
+                                                                                        foreign_key_name)])
+        self.indexed.add(spec.name)
+
+    def drop_indexes(self, spec):
+        statements = self.get_drop_index_statements(spec)
+
+        if self.is_postgres():
+            statements.append('ALTER TABLE "{0}" DROP CONSTRAINT IF EXISTS "{1}"'
+                              .format(munch_spec.get_spec_table_name(spec.name), self.get_foreign_key_name(spec)))
+
+        self.execute_ddl(statements)
+        self.indexed.discard(spec.name)
+
+
+class SqliteSink(MunchSink):
+    def __init__(self, path, config=None):
+        MunchSink.__init__(self, config)
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        # WAL lets readers continue while large transactions are written
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.insert_statements = {}
+
+    def open_table(self, spec, expected_row_count=0):
+        spec_table_name = munch_spec.get_spec_table_name(spec.name)
+        try:
+            columns = ['"id" INTEGER PRIMARY KEY', '"import_log_id" INTEGER']
+            for spec_column in spec.columns:
+                columns.append('"{0}" {1}'.format(spec_column.name, sqlite_types[spec_column.datatype]))
+
+            self.connection.execute('CREATE TABLE IF NOT EXISTS "{0}" ({1})'.format(spec_table_name, ', '.join(columns)))
+            self.add_spec_columns(spec, spec_table_name)
+            key_index = munch_spec.get_spec_key_index(spec)
+            if key_index is not None:
+                self.connection.execute('CREATE UNIQUE INDEX IF NOT EXISTS "{0}" ON "{1}" ({2})'.format(
+                    key_index[0], spec_table_name, ', '.join('"{0}"'.format(name) for name in key_index[1])))
+
+            self.insert_statements[spec.name] = self.get_insert_statement(spec, spec_table_name)
+            self.prepare_indexes(spec, expected_row_count)
+            return True
+        except (sqlite3.Error, KeyError) as e:
+            self.log.error('Failed to open spec table {0} in {1}. Error : {2}'.format(spec_table_name, self.path, e))
+            return False
+
+    def add_spec_columns(self, spec, spec_table_name):
+        """Adds the columns of a later spec version to a table created before it"""
+        existing = set(row[1] for row in self.connection.execute('PRAGMA table_info("{0}")'.format(spec_table_name)))
+        for spec_column in spec.columns:
+            if spec_column.name not in existing:
+                self.connection.execute('ALTER TABLE "{0}" ADD COLUMN "{1}" {2}'.format(
+                    spec_table_name, spec_column.name, sqlite_types[spec_column.datatype]))
+
+    def get_insert_statement(self, spec, table_name):
+        column_names = get_column_names(spec)
+        return 'INSERT INTO "{0}" ({1}) VALUES ({2})'.format(table_name,
+                                                             ', '.join('"{0}"'.format(name) for name in column_names),
+                                                             ', '.join('?' for _ in column_names))
+
+    def write_batch(self, spec, rows):
+        try:
+            if self.is_upsert(spec):
+                self.upsert_batch(spec, rows)
+            else:
+                self.connection.executemany(self.insert_statements[spec.name], rows)
+            return True
+        except (sqlite3.Error, OverflowError) as e:
+            self.log.warn('An error occurred while persisting {0} rows into {1}. Error : {2}'
+                          .format(len(rows), munch_spec.get_spec_table_name(spec.name), e))
+            self.last_error = e
+            self.rollback()
+            return False
+
+    def upsert_batch(self, spec, rows):
+        upsert_table_name = self.get_upsert_table_name(spec)
+        self.connection.execute('CREATE TEMPORARY TABLE IF NOT EXISTS "{0}" AS SELECT * FROM "{1}" WHERE 0'.format(
+            upsert_table_name, munch_spec.get_spec_table_name(spec.name)))
+        self.connection.executemany(self.get_insert_statement(spec, upsert_table_name), rows)
+        self.connection.execute(self.get_merge_statement(spec, upsert_table_name))
+        self.connection.execute('DELETE FROM "{0}"'.format(upsert_table_name))
+
+    def get_merge_select(self, columns, keys, source_table_name):
+        # rows are upserted one at a time, in order, so the row written last for each key is kept.
+        # WHERE true tells the parser that ON CONFLICT belongs to the INSERT, rather than a join
+        return 'SELECT {0} FROM "{1}" WHERE true ORDER BY rowid'.format(columns, source_table_name)
+
+    def commit(self):
+        try:
+            self.connection.commit()
+            return True
+        except sqlite3.Error as e:
+            self.log.warn('An error occurred while committing rows into {0}. Error : {1}'.format(self.path, e))
+            self.last_error = e
+            self.rollback()
+            return False
+
+    def fence(self, import_log_id, node_id):
+        # import_log isn't in the sink's database - claims need the postgres sink
+        return True
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def finalize(self, spec):
+        if not self.commit():
+            return False
+
+        try:
+            self.build_deferred_indexes(spec)
+            return True
+        except sqlite3.Error as e:
+            self.log.error('Failed to build indexes on {0}. Error : {1}'
+                           .format(munch_spec.get_spec_table_name(spec.name), e))
+            return False
+
+    def close(self):
+        self.connection.close()
+
+    def delete_import(self, spec, import_log_id):
+        spec_table_name = munch_spec.get_spec_table_name(spec.name)
+        try:
+            self.connection.execute('DELETE FROM "{0}" WHERE import_log_id = ?'.format(spec_table_name),
+                                    (import_log_id,))
+            self.connection.commit()
+            return True
+        except sqlite3.Error as e:
+            self.log.error('Failed to delete rows for import_log id {0} from {1}. Error : {2}'
+                           .format(import_log_id, spec_table_name, e))
+            return False
+
+    def open_staging(self, spec, import_log_id):
+        staging_table_name = self.get_staging_table_name(spec, import_log_id)
+        try:
+            self.connection.execute('DROP TABLE IF EXISTS "{0}"'.format(staging_table_name))
+            self.connection.execute('CREATE TABLE "{0}" AS SELECT * FROM "{1}" WHERE 0'.format(
+                staging_table_name, munch_spec.get_spec_table_name(spec.name)))
+            self.connection.commit()
+            self.insert_statements[spec.name] = self.get_insert_statement(spec, staging_table_name)
+            self.staged.add(spec.name)
+            return True
+        except sqlite3.Error as e:
+            self.log.error('Failed to create staging table {0} in {1}. Error : {2}'.format(staging_table_name,
+                                                                                           self.path, e))
+            self.rollback()
+            return False
+
+    def swap_staging(self, spec, import_log_id):
+        spec_table_name = munch_spec.get_spec_table_name(spec.name)
+        staging_table_name = self.get_staging_table_name(spec, import_log_id)
+        columns = ', '.join('"{0}"'.format(name) for name in get_column_names(spec))
+        try:
+            self.connection.execute('DELETE FROM "{0}" WHERE import_log_id = ?'.format(spec_table_name),
+                                    (import_log_id,))
+            if spec.key_columns:
+                self.connection.execute(self.get_merge_statement(spec, staging_table_name))
+            else:
+                self.connection.execute('INSERT INTO "{0}" ({1}) SELECT {1} FROM "{2}" ORDER BY rowid'.format(
+                    spec_table_name, columns, staging_table_name))
+            self.connection.execute('DROP TABLE "{0}"'.format(staging_table_name))
+            self.connection.commit()
+            return True
+        except sqlite3.Error as e:
+            self.log.error('Failed to swap staging table {0} into {1}. Error : {2}'
+                           .format(staging_table_name, spec_table_name, e))
+            self.last_error = e
+            self.rollback()
+            return False
+        finally:
+            self.staged.discard(spec.name)
+            self.insert_statements[spec.name] = self.get_insert_statement(spec, spec_table_name)
+
+    def drop_staging(self, spec, import_log_id):
+        staging_table_name = self.get_staging_table_name(spec, import_log_id)
+        try:
+            self.rollback()
+            self.connection.execute('DROP TABLE IF EXISTS "{0}"'.format(staging_table_name))
+            self.connection.commit()
+        except sqlite3.Error as e:
+            self.log.warn('Failed to drop staging table {0} in {1}. Error : {2}'.format(staging_table_name,
+                                                                                       self.path, e))
+        finally:
+            self.staged.discard(spec.name)
+            self.insert_statements[spec.name] = self.get_insert_statement(spec,
+                                                                          munch_spec.get_spec_table_name(spec.name))
+
+    def is_table_empty(self, spec):
+        return self.connection.execute('SELECT 1 FROM "{0}" LIMIT 1'.format(
+            munch_spec.get_spec_table_name(spec.name))).fetchone() is None
+
+    def create_indexes(self, spec, concurrently=False):
+        for statement in self.get_index_statements(spec):
+            self.connection.execute(statement)
+        self.connection.commit()
+
+    def drop_indexes(self, spec):
+        for statement in self.get_drop_index_statements(spec):
+            self.connection.execute(statement)
+        self.connection.commit()
+
+
+class ThreadLocalSink:
+    """Gives each thread its own sink, created by factory when the thread first uses it"""
+    def __init__(self, factory):
+        self.factory = factory
+        self.local = threading.local()
+        # sinks of every thread, closed together
+        self.sinks = []
+        self.lock = threading.Lock()
+
+    def get_sink(self):
+        sink = getattr(self.local, 'sink', None)
+        if sink is None:
+            sink = self.local.sink = self.factory()
+            with self.lock:
+                self.sinks.append(sink)
+        return sink
+
+    def __getattr__(self, name):
+        return getattr(self.get_sink(), name)
+
+    def close(self):
+        with self.lock:
+            sinks, self.sinks = self.sinks, []
+        for sink in sinks:
+            sink.close()
+        # threads which load again after close get a new sink
+        self.local = threading.local()
+
+
+def create_sink(config, sink_type=None, db=None):
+    """Returns a sink of sink_type. A postgres sink writes through db, if one is given"""
+    sink_type = sink_type if sink_type is not None else config.get('sink', 'type', default_sink_type)
+
+    if sink_type == 'postgres':
+        return PostgresSink(config.get('database', 'url', munch_config.default_database_url), config, db)
+    elif sink_type == 'sqlite':
+        return SqliteSink(config.get('sink', 'sqlite_path', default_sqlite_path), config)
+
+    raise ValueError('sink type {0} is not one of {1}'.format(sink_type, sink_types))
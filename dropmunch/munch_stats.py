@@ -0,0 +1,73 @@
+# dropmunch - per-import statistics
+# - accumulates statistics for each spec column while a data file is loaded :
+# -   all columns : row count and null count
+# -   INTEGER     : min, max and sum
+# -   BOOLEAN     : true count
+# -   TEXT        : max length
+# - statistics are persisted into import_stats, one row per import_log row and
+#   column, in the same transaction as the import_log checkpoint
+from dropmunch import munch_spec
+
+stats_fields = ['row_count', 'null_count', 'min_value', 'max_value', 'sum_value', 'true_count', 'max_length']
+
+
+class ColumnStats:
+    def __init__(self, name, datatype):
+        self.name = name
+        self.datatype = munch_spec.SpecDataType[datatype]
+        self.row_count = 0
+        self.null_count = 0
+        self.min_value = None
+        self.max_value = None
+        self.sum_value = None
+        self.true_count = None
+        self.max_length = None
+
+    def add_values(self, values):
+        self.row_count += len(values)
+        null_count = values.count(None)
+
+        if null_count > 0:
+            self.null_count += null_count
+            values = [value for value in values if value is not None]
+            if len(values) == 0:
+                return
+
+        if self.datatype == munch_spec.SpecDataType.INTEGER:
+            self.min_value = min(values) if self.min_value is None else min(self.min_value, min(values))
+            self.max_value = max(values) if self.max_value is None else max(self.max_value, max(values))
+            self.sum_value = (self.sum_value or 0) + sum(values)
+        elif self.datatype == munch_spec.SpecDataType.BOOLEAN:
+            self.true_count = (self.true_count or 0) + sum(values)
+        elif self.datatype == munch_spec.SpecDataType.TEXT:
+            self.max_length = max(self.max_length or 0, max(map(len, values)))
+
+    def load(self, import_stats_row):
+        for field in stats_fields:
+            setattr(self, field, import_stats_row[field])
+
+    def as_row(self, import_log_id):
+        row = dict(import_log_id=import_log_id, column_name=self.name)
+        for field in stats_fields:
+            row[field] = getattr(self, field)
+        return row
+
+
+class ImportStats:
+    def __init__(self, spec):
+        self.columns = [ColumnStats(spec_column.name, spec_column.datatype) for spec_column in spec.columns]
+
+    def add_batch(self, batch):
+        """Accumulates the columns of a munch_batch.RowBatch"""
+        for column_stats, values in zip(self.columns, batch.get_columns()):
+            column_stats.add_values(values)
+
+    def load(self, import_stats_rows):
+        """Resumes accumulating from statistics persisted for a partially processed file"""
+        columns = dict((column_stats.name, column_stats) for column_stats in self.columns)
+        for import_stats_row in import_stats_rows:
+            if import_stats_row['column_name'] in columns:
+                columns[import_stats_row['column_name']].load(import_stats_row)
+
+    def as_rows(self, import_log_id):
+        return [column_stats.as_row(import_log_id) for column_stats in self.columns]
@@ -0,0 +1,118 @@
+# dropmunch - adaptive batch size and concurrency
+# - tunes the rows written per sink commit, per spec table, and the number of
+#   data files loaded at once by drop root workers, from observed commit latency :
+# -   while commits take less than target_commit_seconds, the batch size of the
+#     spec table grows by batch_size_step rows, and a worker is added once every
+#     worker has committed a batch - additive increase
+# -   when a commit takes longer, the database is slowing down - the batch size of
+#     the spec table and the number of workers are halved - multiplicative decrease
+# - batch sizes and workers stay within the configured bounds
+# - the parameters used for each data file are recorded in its import_log row,
+#   along with its average commit latency and rows per second
+import logging
+import threading
+
+default_min_batch_size = 500
+default_max_batch_size = 100000
+default_batch_size_step = 1000
+default_target_commit_seconds = 1.0
+default_min_workers = 1
+
+
+class BatchTuner:
+    """Commit latency, throughput and batch size of a spec table"""
+    __slots__ = ('batch_size', 'row_count', 'commit_count', 'commit_seconds', 'backoff_count')
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.row_count = 0
+        self.commit_count = 0
+        self.commit_seconds = 0.0
+        self.backoff_count = 0
+
+
+class MunchTuner:
+    def __init__(self, batch_size, min_batch_size=default_min_batch_size, max_batch_size=default_max_batch_size,
+                 batch_size_step=default_batch_size_step, target_commit_seconds=default_target_commit_seconds,
+                 workers=1, min_workers=default_min_workers, max_workers=None):
+        self.min_batch_size = max(1, min_batch_size)
+        self.max_batch_size = max(self.min_batch_size, max_batch_size)
+        self.initial_batch_size = self.clamp(batch_size, self.min_batch_size, self.max_batch_size)
+        self.batch_size_step = max(1, batch_size_step)
+        self.target_commit_seconds = target_commit_seconds
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers if max_workers is not None else workers)
+        self.workers = self.clamp(workers, self.min_workers, self.max_workers)
+        # commits since the number of workers last changed
+        self.worker_commit_count = 0
+        # spec name => BatchTuner
+        self.tables = {}
+        # batches of several workers are observed at once
+        self.lock = threading.Lock()
+        self.log = logging.getLogger('MunchTune')
+
+    @staticmethod
+    def clamp(value, minimum, maximum):
+        return max(minimum, min(value, maximum))
+
+    def get_table(self, spec_name):
+        table = self.tables.get(spec_name)
+        if table is None:
+            table = self.tables.setdefault(spec_name, BatchTuner(self.initial_batch_size))
+        return table
+
+    def get_batch_size(self, spec_name):
+        return self.get_table(spec_name).batch_size
+
+    def observe(self, spec_name, row_count, commit_seconds):
+        """Adjusts the batch size of a spec table, and the number of workers, after a batch of
+           row_count rows was committed in commit_seconds"""
+        with self.lock:
+            table = self.get_table(spec_name)
+            table.row_count += row_count
+            table.commit_count += 1
+            table.commit_seconds += commit_seconds
+
+            if commit_seconds > self.target_commit_seconds:
+                table.backoff_count += 1
+                table.batch_size = max(self.min_batch_size, table.batch_size // 2)
+                workers = max(self.min_workers, self.workers // 2)
+                self.log.info('Committing {0} rows to {1} took {2:.3f} seconds. Backing off to batches of {3} rows '
+                              'and {4} workers'.format(row_count, spec_name, commit_seconds, table.batch_size,
+                                                       workers))
+                self.set_workers(workers)
+                return
+
+            # only batches as large as the current size show whether a larger size is fast enough
+            if row_count >= table.batch_size:
+                table.batch_size = min(self.max_batch_size, table.batch_size + self.batch_size_step)
+
+            self.worker_commit_count += 1
+            if self.worker_commit_count >= self.workers and self.workers < self.max_workers:
+                self.set_workers(self.workers + 1)
+
+    def set_workers(self, workers):
+        self.workers = workers
+        self.worker_commit_count = 0
+
+    def get_import_log_values(self, spec_name, commit_count, commit_seconds, row_count):
+        """Returns the parameters used to load a data file, as import_log column values"""
+        return dict(batch_size=self.get_batch_size(spec_name),
+                    workers=self.workers,
+                    avg_commit_seconds=commit_seconds / commit_count if commit_count > 0 else None,
+                    rows_per_second=row_count / commit_seconds if commit_seconds > 0 else None)
+
+
+def create_tuner(config, batch_size, workers=1):
+    """Returns a MunchTuner if tuning is enabled in the [tune] config section, otherwise None"""
+    if not config.get('tune', 'enabled', False, bool):
+        return None
+
+    return MunchTuner(batch_size,
+                      config.get('tune', 'min_batch_size', default_min_batch_size, int),
+                      config.get('tune', 'max_batch_size', default_max_batch_size, int),
+                      config.get('tune', 'batch_size_step', default_batch_size_step, int),
+                      config.get('tune', 'target_commit_seconds', default_target_commit_seconds, float),
+                      workers,
+                      config.get('tune', 'min_workers', default_min_workers, int),
+                      config.get('tune', 'max_workers', workers, int))
@@ -0,0 +1,32 @@
+# dropmunch - fixtures shared by the test modules
+# - the DATAspecvalid spec matches the layout of the data files in fixtures/
+# - configs are read from a nonexistent ini, so only the given settings apply
+import dateutil.parser
+import os
+from dropmunch import munch_config, munch_data, munch_spec
+
+iso8601_timestamp1 = '2007-10-01T13:47:12.345Z'
+valid_datafile_name = 'DATAspecvalid_{0}.txt'.format(iso8601_timestamp1)
+
+
+def get_valid_spec():
+    """Returns the DATAspecvalid spec : a 7 character name and a 1 character valid flag"""
+    return munch_spec.Spec('DATAspecvalid', [munch_spec.SpecColumn('name', 7, 'TEXT'),
+                                             munch_spec.SpecColumn('valid', 1, 'BOOLEAN')])
+
+
+def get_datafile_spec(spec):
+    """Returns the DataFileSpec of a data file of the given spec, timestamped iso8601_timestamp1"""
+    return munch_data.DataFileSpec(spec, dateutil.parser.parse(iso8601_timestamp1))
+
+
+def get_valid_datafile_spec():
+    """Returns the DataFileSpec of valid_datafile_name"""
+    return get_datafile_spec(get_valid_spec())
+
+
+def get_config(settings=''):
+    """Returns a MunchConfig holding only the given ini settings"""
+    config = munch_config.MunchConfig(os.getcwd() + '/fixtures/nonexistent.ini')
+    config.parser.read_string(settings)
+    return config
@@ -0,0 +1,61 @@
+import datetime
+import gzip
+import os
+import tempfile
+import unittest
+from dropmunch import munch_archive
+
+
+class ArchiveBehavior(unittest.TestCase):
+    """Test archival and quarantine of processed data files"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data_directory = self.directory + '/data/'
+        os.makedirs(self.data_directory)
+        self.archive = munch_archive.MunchArchive(self.data_directory, self.directory + '/archive/',
+                                                  self.directory + '/quarantine/', retention_days=30)
+        self.datafile = 'DATAspecvalid_2007-10-01T13:47:12.345Z.txt'
+        with open(self.data_directory + self.datafile, 'wb') as datafile:
+            datafile.write(b'orangey0\npurpley1\n')
+
+    def test_archive_complete_file(self):
+        self.archive.archive(self.datafile, datetime.datetime(2007, 10, 1, 13, 47, 12))
+        self.archive.close()
+
+        path = self.directory + '/archive/2007/10/01/' + self.datafile + '.gz'
+        with gzip.open(path, 'rb') as archived:
+            self.assertEqual(archived.read(), b'orangey0\npurpley1\n', 'the file is compressed into a dated tree')
+        self.assertFalse(os.path.exists(self.data_directory + self.datafile),
+                         'the file is removed from the data directory')
+
+    def test_quarantine_failed_file(self):
+        self.archive.quarantine(self.datafile)
+        self.archive.close()
+
+        self.assertTrue(os.path.exists(self.directory + '/quarantine/' + self.datafile),
+                        'a failed file is moved to the quarantine directory')
+        self.assertFalse(os.path.exists(self.data_directory + self.datafile))
+
+    def test_prune_expired_archives(self):
+        self.archive.archive(self.datafile, datetime.datetime(2007, 10, 1, 13, 47, 12))
+        self.archive.close()
+        path = self.directory + '/archive/2007/10/01/' + self.datafile + '.gz'
+
+        self.assertEqual(self.archive.prune(os.path.getmtime(path) + 29 * 86400), 0,
+                         'archives within the retention period are kept')
+        self.assertEqual(self.archive.prune(os.path.getmtime(path) + 31 * 86400), 1,
+                         'archives older than the retention period are deleted')
+        self.assertFalse(os.path.exists(self.directory + '/archive/2007'), 'emptied date directories are deleted')
+        self.assertTrue(os.path.exists(self.directory + '/archive'), 'the archive directory is kept')
+
+    def test_restore_archived_file(self):
+        self.archive.archive(self.datafile, datetime.datetime(2007, 10, 1, 13, 47, 12))
+        self.archive.close()
+
+        self.assertEqual(self.archive.restore(lambda file: file != self.datafile), [],
+                         'files which aren\'t selected stay archived')
+        self.assertEqual(self.archive.restore(lambda file: file == self.datafile), [self.datafile])
+        with open(self.data_directory + self.datafile, 'rb') as datafile:
+            self.assertEqual(datafile.read(), b'orangey0\npurpley1\n', 'the file is decompressed into the data directory')
+        self.assertEqual(self.archive.restore(lambda file: True), [],
+                         'a file already in the data directory isn\'t restored again')
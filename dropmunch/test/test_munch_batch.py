@@ -0,0 +1,42 @@
+import unittest
+from dropmunch import munch_batch, munch_spec
+
+
+class RowBatchBehavior(unittest.TestCase):
+    """Test parsing records into columnar row batches"""
+    def setUp(self):
+        self.spec = munch_spec.Spec('origspecformat', [munch_spec.SpecColumn('name', 10, 'TEXT'),
+                                                       munch_spec.SpecColumn('unused', 2, 'FILLER'),
+                                                       munch_spec.SpecColumn('count', 3, 'INTEGER')])
+        self.batch = munch_batch.RowBatch(self.spec, 7, 2)
+
+    def test_append_record(self):
+        self.assertTrue(self.batch.append_record(self.spec, b'Barzane   xx-12', 'utf-8'))
+        with self.assertLogs('munch_spec', level='ERROR'):
+            self.assertFalse(self.batch.append_record(self.spec, b'Foonyor   xx  z', 'utf-8'),
+                             'an invalid record is rejected')
+        self.assertTrue(self.batch.append_record(self.spec, b'Quuxitude xx103', 'utf-8'))
+
+        self.assertEqual(len(self.batch), 2, 'only valid records are added')
+        self.assertEqual(self.batch.get_columns(), [['Barzane   ', 'Quuxitude '], [-12, 103]],
+                         'values are parsed into their spec columns')
+        self.assertEqual(list(self.batch), [(7, 'Barzane   ', -12), (7, 'Quuxitude ', 103)],
+                         'rows are available as tuples, preceded by the import_log_id')
+
+    def test_clear_reuses_buffers(self):
+        self.batch.append_record(self.spec, b'Barzane   xx-12', 'utf-8')
+        columns = self.batch.columns
+        self.batch.clear()
+        self.batch.append_record(self.spec, b'Quuxitude xx103', 'utf-8')
+
+        self.assertIs(self.batch.columns, columns, 'column buffers are reused after a batch is cleared')
+        self.assertEqual(list(self.batch), [(7, 'Quuxitude ', 103)], 'a cleared batch only holds new rows')
+
+    def test_grows_beyond_capacity(self):
+        for record in [b'Barzane   xx-12', b'Foonyor   xx  1', b'Quuxitude xx103']:
+            self.batch.append_record(self.spec, record, 'utf-8')
+
+        self.assertEqual(len(self.batch), 3, 'a batch grows when it is used to collect a whole file')
+        self.assertEqual(self.batch[1:].get_columns(), [['Foonyor   ', 'Quuxitude '], [1, 103]],
+                         'a slice of a batch is a batch')
+        self.assertEqual(self.batch[-1], (7, 'Quuxitude ', 103), 'rows may be indexed')
@@ -0,0 +1,35 @@
+import unittest
+from dropmunch import munch_claim
+from unittest.mock import MagicMock
+
+
+class ClaimHeartbeat(unittest.TestCase):
+    """Test renewal of data file leases while a file is loaded"""
+    def setUp(self):
+        self.claim = munch_claim.MunchClaim(MagicMock(), 'node1', lease_seconds=0.03)
+
+    def test_lease_renewed(self):
+        self.claim.renew = MagicMock(return_value=True)
+        heartbeat = self.claim.start_heartbeat(7)
+        heartbeat.join(0.1)
+        heartbeat.stop()
+        heartbeat.join()
+
+        self.assertTrue(self.claim.renew.called, 'the lease is renewed while the file loads')
+        heartbeat.check()
+
+    def test_lease_lost(self):
+        self.claim.renew = MagicMock(return_value=False)
+        heartbeat = self.claim.start_heartbeat(7)
+        heartbeat.join(1)
+
+        with self.assertRaises(munch_claim.ClaimLost):
+            heartbeat.check()
+
+    def test_takeover(self):
+        self.assertTrue(self.claim.is_takeover({'previous_owner': 'node2'}),
+                        'claiming a file owned by another node is a takeover')
+        self.assertFalse(self.claim.is_takeover({'previous_owner': None}),
+                         'claiming an unowned file is not a takeover')
+        self.assertFalse(self.claim.is_takeover({'previous_owner': 'node1'}),
+                         'reclaiming a file owned by this node is not a takeover')
@@ -1,10 +1,17 @@
+import io
 import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
 import unittest
-import dateutil.parser
-from dropmunch import munch_data, munch_spec
+import dataset
+from unittest.mock import MagicMock, patch
+from dropmunch import munch_claim, munch_data, munch_schedule, munch_sink, munch_spec
+from dropmunch.test import helpers
+from dropmunch.test.helpers import iso8601_timestamp1, valid_datafile_name
 
-iso8601_timestamp1 = '2007-10-01T13:47:12.345Z'
-valid_datafile_name = 'DATAspecvalid_{0}.txt'.format(iso8601_timestamp1)
 
 class DataFileProcessing(unittest.TestCase):
 
@@ -34,7 +41,7 @@ class DataFileProcessing(unittest.TestCase):
         spec_columns = [munch_spec.SpecColumn('color', 7, 'TEXT'),
                         munch_spec.SpecColumn('sohot_rightnow', 1, 'BOOLEAN')]
         spec = munch_spec.Spec(spec_name, spec_columns)
-        datafile_spec = munch_data.DataFileSpec(spec, dateutil.parser.parse('2007-10-01T13:47:12.345Z'))
+        datafile_spec = helpers.get_datafile_spec(spec)
         self.munch_spec.persist_spec(spec)
         import_log_row = self.munch_data.create_import_log(datafile_spec)
 
@@ -48,7 +55,7 @@ class DataFileProcessing(unittest.TestCase):
     def test_padded_boolean_column(self):
         self.munch_spec.process_spec_from_file('DATApaddedbool.csv')
         spec = self.munch_spec.load_spec_from_db('DATApaddedbool')
-        datafile_spec = munch_data.DataFileSpec(spec, dateutil.parser.parse(iso8601_timestamp1))
+        datafile_spec = helpers.get_datafile_spec(spec)
         import_log_row = self.munch_data.create_import_log(datafile_spec)
 
         self.assertEquals(self.munch_data.process_datafile('DATApaddedbool_{0}.txt'.format(iso8601_timestamp1),
@@ -60,7 +67,7 @@ class DataFileProcessing(unittest.TestCase):
     def test_invalid_datafile_row(self):
         self.munch_spec.process_spec_from_file('DATAspecvalid.csv')
         spec = self.munch_spec.load_spec_from_db('DATAspecvalid')
-        datafile_spec = munch_data.DataFileSpec(spec, dateutil.parser.parse(iso8601_timestamp1))
+        datafile_spec = helpers.get_datafile_spec(spec)
         import_log_row = self.munch_data.create_import_log(datafile_spec)
 
         filename = 'DATAspecvalid_{0}_badrow.txt'.format(iso8601_timestamp1)
@@ -75,6 +82,482 @@ class DataFileProcessing(unittest.TestCase):
                           1,
                           '1 row failed to be processed from datafile {0}'.format(filename))
 
+
+class RecordReading(unittest.TestCase):
+    """Test reading of fixed-length records from data files"""
+
+    def read_records(self, content, record_width, block_size=8):
+        datafile = io.BytesIO(content)
+        terminator = munch_data.detect_record_terminator(datafile, record_width)
+        return [bytes(record) for record in munch_data.iter_records(datafile, record_width,
+                                                                    record_width + len(terminator),
+                                                                    block_size)]
+
+    def test_unterminated_records(self):
+        self.assertEqual(self.read_records(b'orangey0purpley1mangoes1', 8),
+                         [b'orangey0', b'purpley1', b'mangoes1'],
+                         'records without line terminators are split by record width')
+
+    def test_crlf_records(self):
+        self.assertEqual(self.read_records(b'orangey0\r\npurpley1\r\nmangoes1', 8),
+                         [b'orangey0', b'purpley1', b'mangoes1'],
+                         'CRLF terminators are skipped, including a missing final terminator')
+
+    def test_misaligned_records(self):
+        for block_size in [8, 1024]:
+            with self.assertLogs('MunchData', level='WARNING'):
+                self.assertEqual(self.read_records(b'orangey1\npurpley\nmangoes11\r\nlimey0\n', 8, block_size),
+                                 [b'orangey1', b'purpley', b'mangoes11', b'limey0'],
+                                 'lines after a record without its terminator are read line by line')
+
+    def test_auto_mode_checks_terminators(self):
+        spec = helpers.get_valid_spec()
+        munch = munch_data.MunchData(os.getcwd() + '/fixtures/', sink=munch_sink.SqliteSink(':memory:'))
+        with tempfile.TemporaryFile() as datafile:
+            # 26 bytes, which is a whole number of 9 byte records, missing the final terminator
+            datafile.write(b'orangey1\npurpley\nmangoes11\n')
+            datafile.seek(0)
+            with self.assertLogs('MunchData', level='WARNING'):
+                rows = [bytes(row) for row in munch.read_rows('DATAspecvalid.txt', datafile, spec)]
+
+        self.assertEqual(rows, [b'orangey1', b'purpley', b'mangoes11'],
+                         'rows of the wrong width are rejected, rather than shifting the rows after them')
+
+    def test_short_first_line(self):
+        self.assertIsNone(munch_data.detect_record_terminator(io.BytesIO(b'purpley\norangey0\n'), 8),
+                          'a first line shorter than the record width is not read as records')
+
+class RejectingSink(munch_sink.SqliteSink):
+    """Rejects any batch containing a row with the given name"""
+    def __init__(self, rejected_name):
+        munch_sink.SqliteSink.__init__(self, ':memory:')
+        self.rejected_name = rejected_name
+        self.batch_sizes = []
+
+    def write_batch(self, spec, rows):
+        self.batch_sizes.append(len(rows))
+        if any(row[1] == self.rejected_name for row in rows):
+            self.last_error = sqlite3.IntegrityError('rejected {0}'.format(self.rejected_name))
+            return False
+        return munch_sink.SqliteSink.write_batch(self, spec, rows)
+
+
+class BatchErrorIsolation(unittest.TestCase):
+    """Test isolation of rows rejected by the sink within a batch"""
+    def setUp(self):
+        self.sink = RejectingSink('purpley')
+        self.munch_data = munch_data.MunchData(os.getcwd() + '/fixtures/', sink=self.sink)
+
+    def test_rejected_row_isolated(self):
+        datafile_spec = helpers.get_valid_datafile_spec()
+
+        with self.assertLogs('MunchData', level='ERROR') as logged:
+            processed_row_count = self.munch_data.process_datafile(valid_datafile_name, datafile_spec, 1)
+
+        self.assertEqual(processed_row_count, 2, 'rows outside the rejected row are committed')
+        self.assertEqual(self.munch_data.row_failure_count, 1, 'only the rejected row fails')
+        self.assertRegex(logged.output[0], "Failed to insert row \\['purpley', True\\].*rejected purpley",
+                         'the rejected row is logged with the sink error')
+        self.assertEqual(self.sink.connection.execute('SELECT name FROM import_data_DATAspecvalid '
+                                                      'ORDER BY id').fetchall(),
+                         [('orangey',), ('mangoes',)])
+
+class SinkFailure(unittest.TestCase):
+    """Test loads stopped by sink errors which aren't caused by the rows"""
+    def test_sink_failure_not_bisected(self):
+        sink = DisconnectedSink()
+        munch = munch_data.MunchData(os.getcwd() + '/fixtures/', sink=sink)
+        datafile_spec = helpers.get_valid_datafile_spec()
+
+        with self.assertRaises(munch_data.SinkFailed):
+            munch.process_datafile(valid_datafile_name, datafile_spec, 1)
+        self.assertEqual(sink.batch_sizes, [3], 'a batch which failed for a reason other than its rows isn\'t split')
+        self.assertEqual(munch.row_failure_count, 0, 'no row is counted as rejected')
+
+
+class DisconnectedSink(munch_sink.SqliteSink):
+    """Fails every batch, as if its connection dropped"""
+    def __init__(self):
+        munch_sink.SqliteSink.__init__(self, ':memory:')
+        self.batch_sizes = []
+
+    def write_batch(self, spec, rows):
+        self.batch_sizes.append(len(rows))
+        self.last_error = sqlite3.OperationalError('connection dropped')
+        return False
+
+
+class FailedFileCleanup(unittest.TestCase):
+    """Test which failed data files are quarantined"""
+    def setUp(self):
+        self.scheduled_file = munch_schedule.ScheduledFile(valid_datafile_name, None, dict(id=1, num_rows_processed=0), 0)
+
+    def process(self, sink, spec_columns):
+        munch = munch_data.MunchData(os.getcwd() + '/fixtures/', sink=sink)
+        munch.archive = MagicMock()
+        self.scheduled_file.datafile_spec = helpers.get_datafile_spec(munch_spec.Spec('DATAspecvalid', spec_columns))
+        with self.assertLogs('MunchData', level='WARN'):
+            munch.process_scheduled_file(self.scheduled_file)
+        self.assertEqual(munch.file_failure_count, 1)
+        return munch.archive
+
+    def test_sink_failure_retried(self):
+        archive = self.process(DisconnectedSink(), [munch_spec.SpecColumn('name', 7, 'TEXT'),
+                                                    munch_spec.SpecColumn('valid', 1, 'BOOLEAN')])
+        self.assertFalse(archive.quarantine.called, 'a file the sink failed to load is left in place to be retried')
+
+    def test_rejected_file_quarantined(self):
+        sink = munch_sink.SqliteSink(':memory:')
+        sink.connection.execute('CREATE TABLE import_data_DATAspecvalid (id INTEGER PRIMARY KEY, '
+                                'import_log_id INTEGER, name TEXT CHECK (name = \'limey\'), valid BOOLEAN)')
+        archive = self.process(sink, helpers.get_valid_spec().fields)
+        archive.quarantine.assert_called_once_with(valid_datafile_name)
+
+    def test_invalid_file_quarantined(self):
+        archive = self.process(munch_sink.SqliteSink(':memory:'), [munch_spec.SpecColumn('name', 7, 'INTEGER'),
+                                                                   munch_spec.SpecColumn('valid', 1, 'BOOLEAN')])
+        archive.quarantine.assert_called_once_with(valid_datafile_name)
+
+
+class KeyedLoad(unittest.TestCase):
+    """Test that an aborted file of a spec with key columns leaves the rows of earlier files"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sink = munch_sink.SqliteSink(':memory:')
+        config = helpers.get_config('[spec:DATAspecvalid]\nmax_invalid_rows = 0\n[data]\nbatch_size = 1\n')
+        self.munch = munch_data.MunchData(self.directory + '/', config=config, sink=self.sink)
+        self.munch.update_import_log = MagicMock(return_value=True)
+        self.munch.reset_import_log = MagicMock()
+        self.munch.archive = MagicMock()
+        self.spec = munch_spec.Spec('DATAspecvalid', [munch_spec.SpecColumn('name', 7, 'TEXT', key=True),
+                                                      munch_spec.SpecColumn('valid', 1, 'BOOLEAN')])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def process(self, import_log_id, content):
+        file = 'DATAspecvalid_{0}_{1}.txt'.format(iso8601_timestamp1, import_log_id)
+        with open(self.directory + '/' + file, 'wb') as f:
+            f.write(content)
+        scheduled_file = munch_schedule.ScheduledFile(file, helpers.get_datafile_spec(self.spec),
+                                                      dict(id=import_log_id, num_rows_processed=0), len(content))
+        self.munch.process_scheduled_file(scheduled_file)
+        return file
+
+    def test_aborted_file_keeps_earlier_rows(self):
+        self.process(1, b'orangey0\npurpley1\n')
+        with self.assertLogs('MunchData', level='ERROR'):
+            file = self.process(2, b'orangey1\nshort\n')
+
+        self.assertEqual(self.sink.connection.execute('SELECT import_log_id, name, valid FROM import_data_DATAspecvalid '
+                                                      'ORDER BY name').fetchall(),
+                         [(1, 'orangey', 0), (1, 'purpley', 1)],
+                         'rows of the aborted file are never merged, and rows of earlier files are kept')
+        self.munch.archive.quarantine.assert_called_once_with(file)
+
+
+class StreamedDataFile(unittest.TestCase):
+    """Test loading data files from pipes, which can't seek"""
+    def setUp(self):
+        self.sink = munch_sink.SqliteSink(':memory:')
+        self.munch_data = munch_data.MunchData(os.getcwd() + '/fixtures/', sink=self.sink)
+        self.datafile_spec = helpers.get_valid_datafile_spec()
+
+    def open_pipe(self, content):
+        read_fd, write_fd = os.pipe()
+        with os.fdopen(write_fd, 'wb') as writer:
+            writer.write(content)
+        return os.fdopen(read_fd, 'rb')
+
+    def test_terminator_detected_without_seeking(self):
+        with self.open_pipe(b'orangey0\r\npurpley1\r\n') as pipe:
+            self.assertEqual(munch_data.detect_record_terminator(pipe, 8), b'\r\n',
+                             'the terminator is peeked from a pipe')
+            self.assertEqual(pipe.read(), b'orangey0\r\npurpley1\r\n', 'peeking doesn\'t consume the pipe')
+
+    def test_load_from_stream(self):
+        with self.open_pipe(b'orangey0\npurpley1\nmangoes1') as pipe:
+            load = munch_data.DataFileLoad(valid_datafile_name, self.datafile_spec, 1, stream=pipe)
+            self.assertEqual(self.munch_data.load_datafile(load), 3, 'rows are loaded from a stream')
+
+        self.assertEqual(self.sink.connection.execute('SELECT name FROM import_data_DATAspecvalid '
+                                                      'ORDER BY id').fetchall(),
+                         [('orangey',), ('purpley',), ('mangoes',)])
+
+    def test_short_first_write(self):
+        read_fd, write_fd = os.pipe()
+
+        def write():
+            with os.fdopen(write_fd, 'wb', buffering=0) as writer:
+                writer.write(b'ora')
+                time.sleep(0.1)
+                writer.write(b'ngey1\npurpley0\nmangoes1\n')
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        with os.fdopen(read_fd, 'rb') as pipe:
+            load = munch_data.DataFileLoad(valid_datafile_name, self.datafile_spec, 1, stream=pipe)
+            self.assertEqual(self.munch_data.load_datafile(load), 3,
+                             'the head of a pipe is read until it holds whole records')
+        writer.join()
+
+        self.assertEqual(load.record_stride, 9)
+        self.assertEqual(self.sink.connection.execute('SELECT name FROM import_data_DATAspecvalid '
+                                                      'ORDER BY id').fetchall(),
+                         [('orangey',), ('purpley',), ('mangoes',)])
+
+    def process_named_pipe(self, content=None):
+        """Processes a named pipe in the data directory, written to by a thread unless content is None"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        os.mkfifo(directory + '/' + valid_datafile_name)
+        self.munch_data.working_directory = directory + '/'
+        self.munch_data.update_import_log = MagicMock(return_value=True)
+
+        def write():
+            with open(directory + '/' + valid_datafile_name, 'wb') as writer:
+                writer.write(content)
+
+        writer = threading.Thread(target=write, daemon=True)
+        if content is not None:
+            writer.start()
+            # the writer is attached once it waits for a reader
+            time.sleep(0.1)
+        self.munch_data.process_scheduled_file(munch_schedule.ScheduledFile(valid_datafile_name, self.datafile_spec,
+                                                                            dict(id=1, num_rows_processed=0), None))
+        if content is not None:
+            writer.join()
+
+    def test_named_pipe_without_writer(self):
+        with self.assertLogs('MunchData', level='INFO') as logged:
+            self.process_named_pipe()
+        self.assertIn('No writer is attached', logged.output[-1], 'a pipe without a writer is skipped')
+        self.assertEqual((self.munch_data.processed_count, self.munch_data.file_failure_count), (0, 0))
+
+    def test_named_pipe_with_writer(self):
+        self.process_named_pipe(b'orangey0\npurpley1\nmangoes1\n')
+        self.assertEqual(self.munch_data.processed_count, 1)
+        self.assertEqual(self.sink.connection.execute('SELECT name FROM import_data_DATAspecvalid '
+                                                      'ORDER BY id').fetchall(),
+                         [('orangey',), ('purpley',), ('mangoes',)], 'rows are loaded from a named pipe')
+
+class ErrorBudget(unittest.TestCase):
+    """Test aborting data files which exceed their spec's error budget"""
+    def setUp(self):
+        self.datafile_spec = helpers.get_valid_datafile_spec()
+        self.load = munch_data.DataFileLoad(valid_datafile_name, self.datafile_spec, 1)
+
+    def test_invalid_row_limit(self):
+        self.load.max_invalid_rows = 1
+        self.load.invalid_row_count = 1
+        self.assertIsNone(self.load.get_error_budget_overrun(), 'invalid rows up to the limit are allowed')
+        self.load.invalid_row_count = 2
+        self.assertIsNotNone(self.load.get_error_budget_overrun(), 'invalid rows over the limit exceed the budget')
+
+    def test_invalid_ratio_after_sample(self):
+        self.load.max_invalid_ratio = 0.1
+        self.load.error_sample_rows = 100
+        self.load.invalid_row_count = 20
+        self.load.row_count = 51
+        self.assertIsNone(self.load.get_error_budget_overrun(), 'the ratio is not checked within the leading sample')
+        self.load.row_count = 101
+        self.assertIsNotNone(self.load.get_error_budget_overrun(), 'the ratio is checked after the leading sample')
+        self.load.row_count = 1001
+        self.assertIsNone(self.load.get_error_budget_overrun(), 'the ratio falls as valid rows are read')
+
+    def test_datafile_aborted(self):
+        config = helpers.get_config('[spec:DATAspecvalid]\nmax_invalid_rows = 0\n')
+        munch = munch_data.MunchData(os.getcwd() + '/fixtures/', config=config,
+                                     sink=munch_sink.SqliteSink(':memory:', config))
+
+        with self.assertLogs('MunchData', level='ERROR'):
+            with self.assertRaises(munch_data.ErrorBudgetExceeded):
+                munch.process_datafile('DATAspecvalid_{0}_badrow.txt'.format(iso8601_timestamp1),
+                                       self.datafile_spec, 1)
+
+class SqliteStagingSink(munch_sink.PostgresSink):
+    """A dataset sink on sqlite, which can't create a table LIKE another"""
+    def open_staging(self, spec, import_log_id):
+        self.db.query('CREATE TABLE "{0}" AS SELECT * FROM "{1}" WHERE 0'.format(
+            self.get_staging_table_name(spec, import_log_id), munch_spec.get_spec_table_name(spec.name)))
+        self.db.commit()
+        self.db.begin()
+        self.staged.add(spec.name)
+        return True
+
+
+class AbortedReplace(unittest.TestCase):
+    """Test loading data files after a replace mode load was aborted"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        config = helpers.get_config('[spec:DATAspecvalid]\nmax_invalid_rows = 0\n')
+        self.sink = SqliteStagingSink('sqlite:///{0}/data.sqlite'.format(self.directory), config)
+        self.munch_data = munch_data.MunchData(os.getcwd() + '/fixtures/', config=config, sink=self.sink,
+                                               replace=True)
+        self.datafile_spec = helpers.get_valid_datafile_spec()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_load_after_aborted_replace(self):
+        scheduled_file = munch_schedule.ScheduledFile('DATAspecvalid_{0}_badrow.txt'.format(iso8601_timestamp1),
+                                                      self.datafile_spec, dict(id=1, num_rows_processed=0), 0)
+        with self.assertLogs('MunchData', level='ERROR'):
+            self.munch_data.process_scheduled_file(scheduled_file)
+        self.assertEqual(self.munch_data.file_failure_count, 1, 'the replace is aborted')
+
+        load = munch_data.DataFileLoad(valid_datafile_name, self.datafile_spec, 2)
+        self.assertEqual(self.munch_data.load_datafile(load), 3)
+        self.sink.close()
+
+        with sqlite3.connect('{0}/data.sqlite'.format(self.directory)) as connection:
+            self.assertEqual(connection.execute('SELECT import_log_id, name FROM import_data_DATAspecvalid '
+                                                'ORDER BY id').fetchall(),
+                             [(2, 'orangey'), (2, 'purpley'), (2, 'mangoes')],
+                             'rows of the next file are committed once the staged rows are dropped')
+
+    def test_selected_files(self):
+        badrow_datafile_name = 'DATAspecvalid_{0}_badrow.txt'.format(iso8601_timestamp1)
+        self.assertTrue(self.munch_data.is_selected(badrow_datafile_name), 'every file is replaced by default')
+
+        self.munch_data.replace_spec = 'DATAspecvalid'
+        self.assertTrue(self.munch_data.is_selected(valid_datafile_name))
+        self.assertFalse(self.munch_data.is_selected('DATApaddedbool_{0}.txt'.format(iso8601_timestamp1)),
+                         'only files of the selected spec are replaced')
+
+        self.munch_data.replace_file = valid_datafile_name
+        self.assertTrue(self.munch_data.is_selected(valid_datafile_name))
+        self.assertFalse(self.munch_data.is_selected(badrow_datafile_name), 'only the selected file is replaced')
+
+class ImportLogClaims(unittest.TestCase):
+    """Test import_log updates by nodes sharing a catalog database"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        config = helpers.get_config()
+        self.munch_data = munch_data.MunchData(os.getcwd() + '/fixtures/', config=config,
+                                               sink=munch_sink.MunchSink(config))
+        self.munch_data.db = dataset.connect('sqlite:///{0}/catalog.sqlite'.format(self.directory))
+        self.munch_data.db.query('CREATE TABLE import_format (id INTEGER PRIMARY KEY, name TEXT)')
+        self.munch_data.db.query('CREATE TABLE import_log (id INTEGER PRIMARY KEY, import_format_id INTEGER, '
+                                 'creation_date TEXT, import_status TEXT, num_rows_processed INTEGER, '
+                                 'import_format_version INTEGER, failure_reason TEXT, claimed_by TEXT, '
+                                 'UNIQUE (import_format_id, creation_date))')
+        self.munch_data.db['import_format'].insert(dict(id=1, name='DATAspecvalid'))
+        spec = munch_spec.Spec('DATAspecvalid', [munch_spec.SpecColumn('name', 7, 'TEXT')])
+        self.datafile_spec = helpers.get_datafile_spec(spec)
+
+    def tearDown(self):
+        self.munch_data.db.close()
+        shutil.rmtree(self.directory)
+
+    def test_complete_fenced_by_claim(self):
+        self.munch_data.db['import_log'].insert(dict(id=1, import_status='inprogress', num_rows_processed=0,
+                                                     claimed_by='node2'))
+        self.munch_data.claim = munch_claim.MunchClaim(self.munch_data.db, 'node1')
+
+        with self.assertRaises(munch_claim.ClaimLost):
+            self.munch_data.update_import_log(1, 3, 'complete')
+        self.assertEqual(self.munch_data.db['import_log'].find_one(id=1)['import_status'], 'inprogress',
+                         'a node which lost its claim can\'t complete the file')
+
+        self.munch_data.claim = munch_claim.MunchClaim(self.munch_data.db, 'node2')
+        self.assertTrue(self.munch_data.update_import_log(1, 3, 'complete'))
+        self.assertEqual(self.munch_data.db['import_log'].find_one(id=1)['import_status'], 'complete',
+                         'the node owning the claim completes the file')
+
+    def test_commit_fenced_by_claim(self):
+        self.munch_data.db['import_log'].insert(dict(id=1, import_status='inprogress', num_rows_processed=0,
+                                                     claimed_by='node2'))
+        self.munch_data.claim = munch_claim.MunchClaim(self.munch_data.db, 'node1')
+        self.munch_data.sink = munch_sink.PostgresSink('sqlite:///{0}/catalog.sqlite'.format(self.directory),
+                                                       self.munch_data.config)
+        datafile_spec = helpers.get_valid_datafile_spec()
+
+        load = munch_data.DataFileLoad(valid_datafile_name, datafile_spec, 1)
+        with self.assertRaises(munch_claim.ClaimLost):
+            self.munch_data.load_datafile(load)
+        self.munch_data.abandon_load(load)
+        self.assertEqual(self.munch_data.db['import_data_DATAspecvalid'].count(), 0,
+                         'a node which lost its claim can\'t commit rows')
+
+        self.munch_data.db['import_log'].update(dict(id=1, claimed_by='node1'), ['id'])
+        self.assertEqual(self.munch_data.load_datafile(munch_data.DataFileLoad(valid_datafile_name, datafile_spec, 1)), 3)
+        self.munch_data.sink.close()
+        self.assertEqual(self.munch_data.db['import_data_DATAspecvalid'].count(), 3,
+                         'the node owning the claim commits rows')
+
+    def test_import_log_created_by_another_node(self):
+        timestamp = self.munch_data.format_datetime_for_db(self.datafile_spec.timestamp)
+        other_id = self.munch_data.db['import_log'].insert(dict(import_format_id=1, creation_date=timestamp,
+                                                                import_status='inprogress',
+                                                                num_rows_processed=0))
+        find_one = dataset.Table.find_one
+        lookups = []
+
+        def racing_find_one(table, *args, **kwargs):
+            # the other node inserts its row after this node's first lookup
+            if table.name == 'import_log' and len(lookups) == 0:
+                lookups.append(kwargs)
+                return None
+            return find_one(table, *args, **kwargs)
+
+        with patch.object(dataset.Table, 'find_one', racing_find_one):
+            import_log_row = self.munch_data.create_import_log(self.datafile_spec)
+
+        self.assertIsNotNone(import_log_row, 'losing the race doesn\'t fail the file')
+        self.assertEqual(import_log_row['id'], other_id, 'the other node\'s import_log row is used')
+
+    def process_file_group(self, lost_heartbeat_id=None):
+        """Loads the bad row fixture, as import_log id 1, together with the valid fixture, as import_log id 2"""
+        self.munch_data.sink = munch_sink.SqliteSink(':memory:')
+        self.munch_data.claim = MagicMock(node_id='node1')
+        self.munch_data.claim.claim.side_effect = lambda import_log_id: \
+            self.munch_data.db['import_log'].find_one(id=import_log_id)
+        self.munch_data.claim.is_takeover.return_value = False
+
+        def start_heartbeat(import_log_id):
+            heartbeat = MagicMock()
+            if import_log_id == lost_heartbeat_id:
+                heartbeat.check.side_effect = munch_claim.ClaimLost('lost')
+            return heartbeat
+        self.munch_data.claim.start_heartbeat.side_effect = start_heartbeat
+
+        datafile_spec = helpers.get_valid_datafile_spec()
+        files = ['DATAspecvalid_{0}_badrow.txt'.format(iso8601_timestamp1), valid_datafile_name]
+        scheduled_files = [munch_schedule.ScheduledFile(file, datafile_spec,
+                                                        self.munch_data.db['import_log'].find_one(id=import_log_id), 0)
+                           for import_log_id, file in enumerate(files, 1)]
+        with self.assertLogs('MunchData', level='WARN'):
+            self.munch_data.process_file_group(scheduled_files)
+
+    def test_coalesced_heartbeats(self):
+        for import_log_id in [1, 2]:
+            self.munch_data.db['import_log'].insert(dict(id=import_log_id, import_status='inprogress',
+                                                         num_rows_processed=0, claimed_by='node1'))
+
+        self.process_file_group(lost_heartbeat_id=2)
+        self.assertEqual([args[0] for args in self.munch_data.claim.start_heartbeat.call_args_list[:2]],
+                         [(1,), (2,)], 'each claimed file of a group has a heartbeat')
+        self.assertEqual(self.munch_data.db['import_log'].find_one(id=2)['import_status'], 'inprogress',
+                         'a file whose lease was lost isn\'t committed with the group')
+        self.assertEqual(self.munch_data.db['import_log'].find_one(id=1)['import_status'], 'complete')
+        self.assertEqual((self.munch_data.processed_count, self.munch_data.file_failure_count), (1, 1))
+        self.assertEqual(self.munch_data.row_failure_count, 1,
+                         'rows which failed in the group aren\'t counted again when the file is loaded alone')
+
+    def test_coalesced_import_log_claim_lost(self):
+        self.munch_data.db['import_log'].insert(dict(id=1, import_status='inprogress', num_rows_processed=0,
+                                                     claimed_by='node1'))
+        self.munch_data.db['import_log'].insert(dict(id=2, import_status='inprogress', num_rows_processed=0,
+                                                     claimed_by='node2'))
+
+        self.process_file_group()
+        self.assertEqual(self.munch_data.db['import_log'].find_one(id=1)['import_status'], 'complete',
+                         'files still claimed by the node are completed on their own')
+        self.assertEqual(self.munch_data.db['import_log'].find_one(id=2)['import_status'], 'inprogress')
+        self.assertEqual((self.munch_data.processed_count, self.munch_data.file_failure_count), (1, 1))
+        self.assertEqual(self.munch_data.row_failure_count, 1)
+
 ### TODO - implement unit tests for invalid data conditions :
     # def test_data_file_missing_db_spec_found_file_spec(self):
     #     """when data file's spec is found in filesystem, but
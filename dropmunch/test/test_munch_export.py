@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+from dropmunch import munch_batch, munch_export, munch_spec
+from dropmunch.test import helpers
+
+
+@unittest.skipIf(munch_export.pyarrow is None, 'pyarrow is not installed')
+class ColumnarExportBehavior(unittest.TestCase):
+    """Test export of ingested rows to columnar files"""
+    def setUp(self):
+        self.export_directory = tempfile.mkdtemp() + '/'
+        self.spec = helpers.get_valid_spec()
+        self.datafile = helpers.valid_datafile_name
+
+    def export_rows(self, export_format):
+        munch = munch_export.MunchExport(self.export_directory, export_format)
+        columnar_export = munch.open(self.datafile, self.spec)
+        columnar_export.write_batch(munch_batch.RowBatch.from_rows(
+            self.spec, [[1, 'orangey', False], [1, 'purpley', True]]))
+        columnar_export.write_batch(munch_batch.RowBatch.from_rows(self.spec, [[1, 'mangoes', True]]))
+        columnar_export.close()
+        return columnar_export.path
+
+    def test_parquet_export(self):
+        path = self.export_rows('parquet')
+        parquet_file = munch_export.pyarrow.parquet.ParquetFile(path)
+
+        self.assertEqual(path, self.export_directory + 'DATAspecvalid_2007-10-01T13:47:12.345Z.parquet')
+        self.assertEqual(parquet_file.metadata.num_row_groups, 2, 'each batch is written as a row group')
+        self.assertEqual(parquet_file.read().to_pydict(),
+                         {'import_log_id': [1, 1, 1],
+                          'name': ['orangey', 'purpley', 'mangoes'],
+                          'valid': [False, True, True]},
+                         'exported columns are typed by the spec')
+
+    def test_arrow_export(self):
+        path = self.export_rows('arrow')
+        table = munch_export.pyarrow.ipc.open_file(path).read_all()
+
+        self.assertEqual(table.column('name').to_pylist(), ['orangey', 'purpley', 'mangoes'],
+                         'rows are exported to an Arrow IPC file')
+
+    def test_abort_export(self):
+        columnar_export = munch_export.MunchExport(self.export_directory).open(self.datafile, self.spec)
+        columnar_export.write_batch(munch_batch.RowBatch.from_rows(self.spec, [[1, 'orangey', False]]))
+        columnar_export.abort()
+
+        self.assertEqual(os.listdir(self.export_directory), [], 'an aborted export leaves no files behind')
+
+    def test_unexported_datatype(self):
+        with self.assertRaisesRegex(ValueError, 'FILLER'):
+            munch_export.get_arrow_type(munch_spec.SpecColumn('padding', 3, 'FILLER'))
+
+    def test_unknown_format_disables_export(self):
+        config = helpers.get_config('[export]\nenabled = true\nformat = csv\n')
+        with self.assertLogs('MunchExport', level='ERROR'):
+            self.assertIsNone(munch_export.create_export(config, self.export_directory),
+                              'an unknown export format is logged, and export is disabled')
@@ -0,0 +1,87 @@
+import datetime
+import json
+import unittest
+import urllib.request
+from dropmunch import munch_data, munch_progress, munch_spec
+from dropmunch.test import helpers
+
+
+class ProgressBehavior(unittest.TestCase):
+    """Test live progress of data file loads"""
+    def setUp(self):
+        spec = munch_spec.Spec('DATAspecvalid', [munch_spec.SpecColumn('color', 7, 'TEXT'),
+                                                 munch_spec.SpecColumn('sohot_rightnow', 1, 'BOOLEAN')])
+        datafile_spec = munch_data.DataFileSpec(spec, datetime.datetime(2007, 10, 1, 13, 47, 12))
+        self.load = munch_data.DataFileLoad('DATAspecvalid_2007-10-01T13:47:12.345Z.txt', datafile_spec, 1)
+        self.progress = munch_progress.MunchProgress()
+        self.progress.started = 100.0
+
+    def tearDown(self):
+        self.progress.close()
+
+    def test_file_progress(self):
+        # 1000 records of 8 bytes and a newline
+        self.progress.add_scheduled(2, 9000 + 1000)
+        self.progress.start_load(self.load, 9000)
+        self.progress.files[1].started = 100.0
+        self.load.record_stride = 9
+        self.load.row_count = 1 + 250
+        self.load.processed_row_count = 200
+
+        snapshot = self.progress.snapshot(110.0)
+        file_progress = snapshot['files'][0]
+
+        self.assertEqual(file_progress['rows_total'], 1000, 'total rows are known from the file size')
+        self.assertEqual(file_progress['bytes_read'], 2250)
+        self.assertEqual(file_progress['rows_per_second'], 25.0)
+        self.assertEqual(file_progress['eta_seconds'], 30.0, '750 rows remain at 25 rows per second')
+        self.assertEqual(snapshot['bytes_done'], 2250)
+        self.assertEqual(snapshot['rows_committed'], 200)
+        self.assertEqual(snapshot['eta_seconds'], 34.4, '7750 bytes remain at 225 bytes per second')
+
+    def test_finished_load(self):
+        self.progress.add_scheduled(1, 9000)
+        self.progress.start_load(self.load, 9000)
+        self.load.processed_row_count = 1000
+        self.progress.finish_load(self.load)
+
+        snapshot = self.progress.snapshot(110.0)
+        self.assertEqual((snapshot['files_done'], snapshot['bytes_done'], snapshot['rows_committed']),
+                         (1, 9000, 1000))
+        self.assertEqual(snapshot['files'], [])
+        self.assertEqual(snapshot['eta_seconds'], 0.0)
+
+    def test_retried_load_is_not_done(self):
+        self.progress.start_load(self.load, 9000)
+        self.progress.finish_load(self.load, False)
+
+        snapshot = self.progress.snapshot(110.0)
+        self.assertEqual((snapshot['files_done'], snapshot['files']), (0, []),
+                         'a load which will be retried is only counted once it is done')
+
+    def test_streamed_file_progress(self):
+        self.progress.start_load(self.load, 0)
+        self.load.row_count = 1 + 10
+
+        file_progress = self.progress.snapshot()['files'][0]
+        self.assertEqual(file_progress['bytes_read'], 90, 'lines of a record width and a newline are read')
+        self.assertIsNone(file_progress['rows_total'], 'the size of a streamed file isn\'t known')
+        self.assertIsNone(file_progress['eta_seconds'])
+
+    def test_serve_progress(self):
+        self.progress.add_scheduled(1, 9000)
+        self.progress.serve(port=0)
+
+        with urllib.request.urlopen('http://127.0.0.1:{0}/'.format(self.progress.server.server_port)) as response:
+            snapshot = json.loads(response.read().decode('utf-8'))
+
+        self.assertEqual(snapshot['files_total'], 1)
+        self.assertEqual(snapshot['bytes_total'], 9000)
+
+    def test_progress_disabled(self):
+        config = helpers.get_config()
+        self.assertIsNone(munch_progress.create_progress(config), 'progress is only served when enabled')
+
+
+if __name__ == '__main__':
+    unittest.main()
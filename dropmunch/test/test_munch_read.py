@@ -0,0 +1,66 @@
+import dataset
+import datetime
+import tempfile
+import unittest
+from dropmunch import munch_config, munch_read, munch_sink
+from dropmunch.test import helpers
+
+
+class ImportReading(unittest.TestCase):
+    """Test streaming of ingested rows, using SQLite for the catalog and the sink"""
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        with open(directory + '/dropmunch.ini', 'w') as config_file:
+            config_file.write('[database]\nurl = sqlite:///{0}/catalog.sqlite\n'
+                              '[sink]\ntype = sqlite\nsqlite_path = {0}/data.sqlite\n'.format(directory))
+        self.config = munch_config.MunchConfig(directory + '/dropmunch.ini')
+
+        db = dataset.connect('sqlite:///{0}/catalog.sqlite'.format(directory))
+        format_id = db['import_format'].insert(dict(name='DATAspecvalid'))
+        db['import_format_column'].insert(dict(import_format_id=format_id, name='name', width=7,
+                                               datatype='TEXT', nullable=False))
+        db['import_format_column'].insert(dict(import_format_id=format_id, name='valid', width=1,
+                                               datatype='BOOLEAN', nullable=False))
+        self.first_id = db['import_log'].insert(dict(import_format_id=format_id, import_status='complete',
+                                                     creation_date='2007-10-01T13:47:12.345'))
+        self.second_id = db['import_log'].insert(dict(import_format_id=format_id, import_status='complete',
+                                                      creation_date='2008-10-01T13:47:12.345'))
+        db.close()
+
+        spec = helpers.get_valid_spec()
+        sink = munch_sink.SqliteSink('{0}/data.sqlite'.format(directory), self.config)
+        sink.open_table(spec)
+        sink.write_batch(spec, [[self.first_id, 'orangey', False], [self.first_id, 'purpley', True],
+                                [self.first_id, 'mangoes', True], [self.second_id, 'greensy', False]])
+        sink.finalize(spec)
+        sink.close()
+
+    def tearDown(self):
+        munch_read.close_readers()
+
+    def test_iter_import_rows(self):
+        batches = list(munch_read.iter_import('DATAspecvalid', self.first_id, batch_size=2, config=self.config))
+        self.assertEqual(batches, [[('orangey', False), ('purpley', True)], [('mangoes', True)]],
+                         'rows of one import are streamed in batches')
+
+    def test_iter_import_columns(self):
+        batches = list(munch_read.iter_import('DATAspecvalid', self.first_id, layout='columns', config=self.config))
+        self.assertEqual(batches, [{'name': ['orangey', 'purpley', 'mangoes'], 'valid': [False, True, True]}],
+                         'batches can be laid out as column lists')
+
+    def test_iter_imports_time_range(self):
+        batches = list(munch_read.iter_imports('DATAspecvalid', start=datetime.datetime(2008, 1, 1),
+                                               config=self.config))
+        self.assertEqual(batches, [[('greensy', False)]],
+                         'only imports of data files within the time range are streamed')
+
+    def test_helpers_share_a_reader(self):
+        list(munch_read.iter_import('DATAspecvalid', self.first_id, config=self.config))
+        reader = munch_read.get_reader(self.config)
+        list(munch_read.iter_imports('DATAspecvalid', config=self.config))
+        self.assertIs(munch_read.get_reader(self.config), reader, 'helper calls reuse one connection')
+
+    def test_reader_closed(self):
+        with munch_read.MunchRead(self.config) as reader:
+            self.assertEqual(reader.get_import_log_ids('DATAspecvalid'), [self.first_id, self.second_id])
+        self.assertEqual(reader.data_engine.pool.checkedout(), 0, 'closing a reader releases its connections')
@@ -0,0 +1,90 @@
+import datetime
+import threading
+import unittest
+from dropmunch import munch_data, munch_roots, munch_schedule, munch_sink, munch_spec
+from dropmunch.test import helpers
+
+
+class DropRootConfiguration(unittest.TestCase):
+    """Test serving several drop roots from one process"""
+    def setUp(self):
+        self.config = helpers.get_config('[roots]\nworkers = 3\n'
+                                         '[root:feeda]\ndirectory = /srv/feeda\nnamespace = feeda\npriority = 5\n'
+                                         '[root:feedb]\ndirectory = /srv/feedb\n')
+
+    def test_no_roots(self):
+        config = helpers.get_config()
+        self.assertIsNone(munch_roots.create_roots(config, sink=munch_sink.SqliteSink(':memory:')),
+                          'without root sections, the working directory is served')
+
+    def test_roots(self):
+        roots = munch_roots.create_roots(self.config, sink=munch_sink.SqliteSink(':memory:'))
+        feeda, feedb = roots.roots
+
+        self.assertEqual((feeda.name, feedb.name), ('feeda', 'feedb'))
+        self.assertEqual(feeda.munch_data.working_directory, '/srv/feeda/data/',
+                         'each root has its own data directory')
+        self.assertEqual(feeda.munch_spec.working_directory, '/srv/feeda/specs/',
+                         'each root has its own spec directory')
+        self.assertEqual((feeda.munch_data.namespace, feeda.munch_spec.namespace), ('feeda', 'feeda'),
+                         'specs of a root are namespaced')
+        self.assertEqual((feeda.munch_data.priority, feedb.munch_data.priority), (5, None))
+        self.assertIs(feeda.munch_data.db, feedb.munch_data.db, 'roots share the catalog database')
+        self.assertIs(feeda.munch_data.sink, feedb.munch_data.sink, 'roots share the sink')
+        self.assertEqual(roots.workers, 1, 'the sqlite sink is used by a single worker')
+
+    def test_spec_priority(self):
+        self.config.parser.read_string('[specs]\npriority = 1\n[spec:feedahotcolors]\npriority = 9\n')
+        feeda, feedb = munch_roots.create_roots(self.config, sink=munch_sink.SqliteSink(':memory:')).roots
+
+        self.assertEqual(feeda.munch_data.get_spec_priority('feedahotcolors'), 9, 'a spec\'s own priority comes first')
+        self.assertEqual(feeda.munch_data.get_spec_priority('feedacoldcolors'), 5,
+                         'the root\'s priority comes before the [specs] priority')
+        self.assertEqual(feedb.munch_data.get_spec_priority('coldcolors'), 1)
+
+    def test_coalesced_files(self):
+        self.config.parser.read_string('[data]\ncoalesce = true\n')
+        feeda = munch_roots.create_roots(self.config, sink=munch_sink.SqliteSink(':memory:')).roots[0]
+        spec = munch_spec.Spec('feedahotcolors', [munch_spec.SpecColumn('color', 7, 'TEXT')])
+        scheduler = munch_schedule.MunchScheduler()
+        files = [munch_schedule.ScheduledFile('feedahotcolors_{0}.txt'.format(day),
+                                              munch_data.DataFileSpec(spec, datetime.datetime(2007, 10, day)),
+                                              None, 100, feeda.munch_data) for day in [1, 2, 3]]
+        for scheduled_file in files:
+            scheduler.add(scheduled_file)
+
+        self.assertEqual(feeda.munch_data.take_group(scheduler, scheduler.take()), files,
+                         'small files of a root\'s spec are loaded together')
+
+    def test_worker_sinks(self):
+        self.config.parser.read_string('[sink]\ntype = postgres\n')
+        roots = munch_roots.create_roots(self.config)
+        self.assertEqual(roots.workers, 3, 'postgres sinks are created for each worker')
+
+        roots.sink.factory = lambda: munch_sink.MunchSink(self.config)
+        sinks = []
+        threads = [threading.Thread(target=lambda: sinks.append(roots.sink.get_sink())) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        sinks.append(roots.sink.get_sink())
+
+        self.assertEqual(len(set(id(sink) for sink in sinks)), 3, 'each thread has its own sink')
+        self.assertIs(roots.sink.get_sink(), sinks[2], 'a thread keeps its sink')
+
+    def test_worker_sinks_share_engine(self):
+        self.config.parser.read_string('[sink]\ntype = postgres\n')
+        roots = munch_roots.create_roots(self.config)
+        sinks = []
+        thread = threading.Thread(target=lambda: sinks.append(roots.sink.get_sink()))
+        thread.start()
+        thread.join()
+        sinks.append(roots.sink.get_sink())
+
+        self.assertIsNot(sinks[0], sinks[1])
+        self.assertTrue(all(sink.db is roots.sink_db for sink in sinks),
+                        'the sinks of every worker share one engine, and so one connection pool')
+        roots.sink.close()
+        self.assertIsNotNone(roots.sink_db.engine, 'the shared engine is closed once, by its owner')
+        roots.cleanup()
+        self.assertIsNone(roots.sink_db.engine)
@@ -0,0 +1,100 @@
+import datetime
+import unittest
+from dropmunch import munch_data, munch_schedule, munch_spec
+
+
+def scheduled_file(spec_name, timestamp, size):
+    spec = munch_spec.Spec(spec_name, [munch_spec.SpecColumn('name', 7, 'TEXT')])
+    datafile_spec = munch_data.DataFileSpec(spec, munch_data.parse_timestamp(timestamp))
+    return munch_schedule.ScheduledFile('{0}_{1}.txt'.format(spec_name, timestamp), datafile_spec, None, size)
+
+
+class DataFileScheduling(unittest.TestCase):
+    """Test ordering of data files by the scheduler"""
+
+    def setUp(self):
+        self.big_old = scheduled_file('big', '2007-10-01T13:47:12.345Z', 50000)
+        self.big_new = scheduled_file('big', '2007-10-02T13:47:12.345Z', 10)
+        self.small = scheduled_file('small', '2008-10-01T13:47:12.345Z', 100)
+
+    def schedule(self, scheduler):
+        for file in [self.big_new, self.small, self.big_old]:
+            scheduler.add(file)
+        return [file.file for file in scheduler]
+
+    def test_shortest_first(self):
+        self.assertEqual(self.schedule(munch_schedule.MunchScheduler('shortest')),
+                         [self.small.file, self.big_old.file, self.big_new.file],
+                         'small files are processed first, but files of one spec stay in timestamp order')
+
+    def test_pipe_after_sized_files(self):
+        scheduler = munch_schedule.MunchScheduler('shortest')
+        pipe = scheduled_file('pipe', '2006-10-01T13:47:12.345Z', None)
+        scheduler.add(pipe)
+        self.assertEqual(self.schedule(scheduler)[-1], pipe.file,
+                         'a named pipe, whose size isn\'t known, is processed after files of any size')
+
+    def test_oldest_first(self):
+        self.assertEqual(self.schedule(munch_schedule.MunchScheduler('oldest')),
+                         [self.big_old.file, self.big_new.file, self.small.file],
+                         'files with the oldest timestamp are processed first')
+
+    def test_priority(self):
+        scheduler = munch_schedule.MunchScheduler('priority', priorities={'small': 10})
+        self.assertEqual(self.schedule(scheduler),
+                         [self.small.file, self.big_old.file, self.big_new.file],
+                         'files of the highest priority spec are processed first')
+
+    def test_max_files_per_spec(self):
+        scheduler = munch_schedule.MunchScheduler('oldest', max_files_per_spec=1)
+        for file in [self.big_new, self.small, self.big_old]:
+            scheduler.add(file)
+
+        first = scheduler.take()
+        second = scheduler.take()
+        self.assertEqual([first.file, second.file], [self.big_old.file, self.small.file],
+                         'a second file of a spec is not released while one is in progress')
+        self.assertIsNone(scheduler.take(), 'no file is released while every spec is at its limit')
+
+        scheduler.done(first)
+        self.assertEqual(scheduler.take().file, self.big_new.file,
+                         'the next file of a spec is released once the previous one is done')
+
+    def test_spec_timestamp_order(self):
+        scheduler = munch_schedule.MunchScheduler('oldest')
+        timestamps = ['2007-10-0{0}T13:47:12.345Z'.format(day) for day in [3, 1, 4, 1, 5, 9, 2, 6]]
+        files = [scheduled_file('big', timestamp, size) for size, timestamp in enumerate(timestamps)]
+        for file in files:
+            scheduler.add(file)
+
+        self.assertEqual([file.size for file in scheduler], [1, 3, 6, 0, 2, 4, 7, 5],
+                         'files of a spec are taken in timestamp order, and in the order added for the same timestamp')
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            munch_schedule.MunchScheduler('random')
+
+    def test_take_following(self):
+        scheduler = munch_schedule.MunchScheduler('oldest')
+        big_newest = scheduled_file('big', '2007-10-03T13:47:12.345Z', 20)
+        for file in [self.big_new, self.small, self.big_old, big_newest]:
+            scheduler.add(file)
+
+        first = scheduler.take()
+        self.assertEqual(scheduler.take_following(first, 10, 1000), [self.big_new, big_newest],
+                         'following small files of the same spec are taken in timestamp order')
+        self.assertEqual(scheduler.take().file, self.small.file,
+                         'files of the spec are not released while the group is in progress')
+
+        for file in [first, self.big_new, big_newest]:
+            scheduler.done(file)
+        self.assertEqual(scheduler.in_progress['big'], 0, 'each file of the group is marked done')
+
+    def test_take_following_limits(self):
+        scheduler = munch_schedule.MunchScheduler('oldest')
+        for file in [self.big_new, self.big_old]:
+            scheduler.add(file)
+
+        first = scheduler.take()
+        self.assertEqual(scheduler.take_following(first, 0, 1000), [], 'no more than max_files are taken')
+        self.assertEqual(scheduler.take_following(first, 10, 10), [], 'files of max_size or more are not taken')
@@ -0,0 +1,200 @@
+import datetime
+import decimal
+import sqlalchemy
+import unittest
+from dropmunch import munch_sink, munch_spec
+from dropmunch.test import helpers
+
+
+class SqliteSinkBehavior(unittest.TestCase):
+    """Test persisting batches of rows into a local SQLite database"""
+    def setUp(self):
+        self.spec = helpers.get_valid_spec()
+        self.sink = munch_sink.SqliteSink(':memory:')
+
+    def tearDown(self):
+        self.sink.close()
+
+    def select_rows(self):
+        return self.sink.connection.execute('SELECT import_log_id, name, valid '
+                                            'FROM import_data_DATAspecvalid ORDER BY id').fetchall()
+
+    def test_write_batch(self):
+        self.assertTrue(self.sink.open_table(self.spec), 'spec table is created')
+        self.assertTrue(self.sink.write_batch(self.spec, [[1, 'orangey', False], [1, 'purpley', True]]),
+                        'a batch of rows is written')
+        self.assertTrue(self.sink.finalize(self.spec), 'written rows are committed')
+        self.assertEqual(self.select_rows(), [(1, 'orangey', 0), (1, 'purpley', 1)],
+                         'rows are persisted into the spec table')
+
+    def test_failed_batch_rolled_back(self):
+        self.sink.open_table(self.spec)
+        self.sink.write_batch(self.spec, [[1, 'orangey', False]])
+        self.sink.commit()
+
+        with self.assertLogs('MunchSink', level='WARNING'):
+            self.assertFalse(self.sink.write_batch(self.spec, [[2, 'purpley', True], [2, 'mangoes']]),
+                             'a batch containing an invalid row fails')
+        self.sink.finalize(self.spec)
+        self.assertEqual(self.select_rows(), [(1, 'orangey', 0)],
+                         'a failed batch is rolled back, leaving committed batches in place')
+
+    def test_data_errors(self):
+        self.sink.open_table(self.spec)
+        with self.assertLogs('MunchSink', level='WARNING'):
+            self.assertFalse(self.sink.write_batch(self.spec, [[1, 'orangey', 2 ** 70]]))
+        self.assertTrue(munch_sink.is_data_error(self.sink.last_error), 'a value the database can\'t store is a data error')
+        self.assertTrue(munch_sink.is_data_error(sqlalchemy.exc.IntegrityError('INSERT', {}, Exception())))
+        self.assertFalse(munch_sink.is_data_error(sqlalchemy.exc.OperationalError('INSERT', {}, Exception())),
+                         'a dropped connection isn\'t caused by the rows')
+
+    def get_index_names(self):
+        return [row[0] for row in self.sink.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'import_data_DATAspecvalid'")]
+
+    def test_indexes_live_for_incremental_load(self):
+        self.sink.open_table(self.spec, expected_row_count=3)
+        self.assertEqual(self.get_index_names(), ['ix_import_data_DATAspecvalid_import_log_id'],
+                         'indexes are created before a small load')
+
+    def test_bulk_load_defers_indexes(self):
+        self.sink.bulk_load_min_rows = 2
+        self.sink.open_table(self.spec, expected_row_count=3)
+        self.assertEqual(self.get_index_names(), [], 'indexes are not maintained during a bulk load')
+
+        self.sink.write_batch(self.spec, [[1, 'orangey', False], [1, 'purpley', True], [1, 'mangoes', True]])
+        self.sink.finalize(self.spec)
+        self.assertEqual(self.get_index_names(), ['ix_import_data_DATAspecvalid_import_log_id'],
+                         'deferred indexes are built when the bulk load is finalized')
+
+        self.sink.open_table(self.spec, expected_row_count=3)
+        self.assertEqual(self.get_index_names(), ['ix_import_data_DATAspecvalid_import_log_id'],
+                         'a large load into a non-empty table keeps indexes live')
+
+    def stage_replacement(self):
+        self.sink.open_table(self.spec)
+        self.sink.write_batch(self.spec, [[1, 'orangey', False], [2, 'purpley', True]])
+        self.sink.commit()
+
+        self.assertTrue(self.sink.open_staging(self.spec, 1), 'staging table is created')
+        self.sink.write_batch(self.spec, [[1, 'mangoes', True], [1, 'bananas', False]])
+        self.sink.commit()
+        self.assertEqual(self.select_rows(), [(1, 'orangey', 0), (2, 'purpley', 1)],
+                         'staged rows are not visible in the spec table')
+
+    def test_swap_staging(self):
+        self.stage_replacement()
+        self.assertTrue(self.sink.swap_staging(self.spec, 1), 'staged rows are swapped in')
+        self.assertEqual(self.select_rows(), [(2, 'purpley', 1), (1, 'mangoes', 1), (1, 'bananas', 0)],
+                         'rows of the import_log row are replaced by the staged rows, in order')
+
+        self.sink.write_batch(self.spec, [[3, 'apricot', True]])
+        self.sink.commit()
+        self.assertEqual(self.select_rows()[-1], (3, 'apricot', 1), 'later rows are written to the spec table')
+
+    def test_drop_staging(self):
+        self.stage_replacement()
+        self.sink.drop_staging(self.spec, 1)
+        self.assertEqual(self.select_rows(), [(1, 'orangey', 0), (2, 'purpley', 1)],
+                         'dropping the staging table leaves the spec table unchanged')
+        self.assertIsNone(self.sink.connection.execute(
+            "SELECT name FROM sqlite_master WHERE name = 'import_data_DATAspecvalid_staging_1'").fetchone(),
+            'the staging table is dropped')
+
+    def test_spec_version_adds_columns(self):
+        self.sink.open_table(self.spec)
+        self.sink.write_batch(self.spec, [[1, 'orangey', False]])
+        self.sink.finalize(self.spec)
+
+        spec = munch_spec.Spec('DATAspecvalid', self.spec.fields + [munch_spec.SpecColumn('count', 3, 'INTEGER',
+                                                                                          nullable=True)], 2)
+        self.assertTrue(self.sink.open_table(spec), 'the spec table of an earlier version is opened')
+        self.sink.write_batch(spec, [[2, 'purpley', True, 12]])
+        self.sink.finalize(spec)
+        self.assertEqual(self.sink.connection.execute('SELECT import_log_id, count FROM import_data_DATAspecvalid '
+                                                      'ORDER BY id').fetchall(), [(1, None), (2, 12)],
+                         'new columns are added, leaving rows already loaded in place')
+
+    def test_typed_columns(self):
+        spec = munch_spec.Spec('DATAspectyped', [munch_spec.SpecColumn('price', 7, 'DECIMAL', scale=2),
+                                                 munch_spec.SpecColumn('sold_at', 14, 'TIMESTAMP')])
+        self.sink.open_table(spec)
+        self.sink.write_batch(spec, [[1, decimal.Decimal('12.30'), datetime.datetime(2007, 10, 1, 13, 47, 12)]])
+        self.sink.finalize(spec)
+        self.assertEqual(self.sink.connection.execute('SELECT CAST(price AS TEXT), sold_at '
+                                                      'FROM import_data_DATAspectyped').fetchall(),
+                         [('12.3', '2007-10-01 13:47:12')], 'decimals are stored as numbers, and timestamps as ISO text')
+
+
+class SqliteSinkUpsertBehavior(unittest.TestCase):
+    """Test upserting rows of a spec with key columns"""
+    def setUp(self):
+        self.spec = munch_spec.Spec('DATAspeckeyed', [munch_spec.SpecColumn('name', 7, 'TEXT', key=True),
+                                                      munch_spec.SpecColumn('valid', 1, 'BOOLEAN')])
+        self.sink = munch_sink.SqliteSink(':memory:')
+        self.sink.open_table(self.spec)
+
+    def tearDown(self):
+        self.sink.close()
+
+    def select_rows(self):
+        return self.sink.connection.execute('SELECT import_log_id, name, valid '
+                                            'FROM import_data_DATAspeckeyed ORDER BY name').fetchall()
+
+    def test_upsert_batch(self):
+        self.sink.write_batch(self.spec, [[1, 'orangey', False], [1, 'purpley', True]])
+        self.sink.commit()
+        self.assertTrue(self.sink.write_batch(self.spec, [[2, 'purpley', False], [2, 'mangoes', True],
+                                                          [2, 'mangoes', False]]),
+                        'a batch is merged into the spec table')
+        self.sink.commit()
+
+        self.assertEqual(self.select_rows(), [(2, 'mangoes', 0), (1, 'orangey', 0), (2, 'purpley', 0)],
+                         'rows with stored keys replace the stored rows, and the last of a batch\'s duplicates wins')
+
+    def test_swap_staging_upserts(self):
+        self.sink.write_batch(self.spec, [[1, 'orangey', False], [2, 'purpley', True]])
+        self.sink.commit()
+
+        self.sink.open_staging(self.spec, 1)
+        self.sink.write_batch(self.spec, [[1, 'orangey', True], [1, 'purpley', False]])
+        self.sink.commit()
+        self.assertTrue(self.sink.swap_staging(self.spec, 1), 'staged rows are merged in')
+
+        self.assertEqual(self.select_rows(), [(1, 'orangey', 1), (1, 'purpley', 0)],
+                         'staged rows replace stored rows with the same keys')
+
+        self.sink.write_batch(self.spec, [[3, 'orangey', False]])
+        self.sink.commit()
+        self.assertEqual(self.select_rows()[0], (3, 'orangey', 0), 'later rows are upserted into the spec table')
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, sql, parameters, **options):
+        self.statements.append((sql, parameters, options))
+
+
+class PreparedInsertBehavior(unittest.TestCase):
+    """Test paging rows through multi-row INSERT statements"""
+    def test_pages(self):
+        prepared_insert = munch_sink.PreparedInsert('import_data_DATAspecvalid', ['import_log_id', 'name'], 2)
+        cursor = RecordingCursor()
+        prepared_insert.execute(cursor, [[1, 'orangey'], [1, 'purpley'], [1, 'mangoes']])
+
+        self.assertEqual(cursor.statements[0],
+                         ('INSERT INTO "import_data_DATAspecvalid" ("import_log_id", "name") VALUES (%s, %s), (%s, %s)',
+                          [1, 'orangey', 1, 'purpley'], {}),
+                         'full pages of rows use the statement built up front')
+        self.assertEqual(cursor.statements[1],
+                         ('INSERT INTO "import_data_DATAspecvalid" ("import_log_id", "name") VALUES (%s, %s)',
+                          [1, 'mangoes'], {}),
+                         'the last page of a batch may be partial')
+
+    def test_page_size_limited_by_parameters(self):
+        prepared_insert = munch_sink.PreparedInsert('import_data_wide', ['column{0}'.format(i) for i in range(100)],
+                                                    1000, prepare=True)
+        self.assertEqual(prepared_insert.page_size, 655, 'a page never exceeds the statement parameter limit')
+        self.assertEqual(prepared_insert.execute_options, dict(prepare=True), 'full pages are prepared on the server')
@@ -1,4 +1,10 @@
+import dataset
+import datetime
+import decimal
 import os
+import shutil
+import sqlalchemy
+import tempfile
 import unittest
 from dropmunch import munch_spec
 from unittest.mock import MagicMock
@@ -182,4 +188,255 @@ class SpecFileProcessing(unittest.TestCase):
     #
     # def test_spec_success_saving_to_db(self):
     #     """when a spec is validated and saved to the database, (...cleanup takes place...)"""
-    #     self.assertTrue(False)
\ No newline at end of file
+    #     self.assertTrue(False)
+
+
+class SpecRegistration(unittest.TestCase):
+    """Test registering many spec files together"""
+    def setUp(self):
+        self.working_directory = tempfile.mkdtemp() + '/'
+        for name in ['feed1', 'feed2', 'feed3']:
+            self.write_spec_file(name, '"column name",width,datatype\nname,10,TEXT\ncount,3,INTEGER\n')
+        self.write_spec_file('feedbroken', '"column name",width\nname,10\n')
+        self.db = dataset.connect('sqlite:///' + self.working_directory + 'catalog.sqlite')
+        self.munch_spec = munch_spec.MunchSpec(self.working_directory, db=self.db)
+        self.munch_spec.config.parser.read_string('[spec_files]\nbatch_size = 2\n')
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.working_directory)
+
+    def write_spec_file(self, name, content):
+        with open(self.working_directory + name + '.csv', 'w') as spec_file:
+            spec_file.write(content)
+
+    def test_register_spec_files(self):
+        with self.assertLogs('MunchSpecs', level='ERROR'):
+            outcomes = self.munch_spec.register_spec_files()
+
+        self.assertEqual(outcomes, {'feed1.csv': 'registered', 'feed2.csv': 'registered',
+                                    'feed3.csv': 'registered', 'feedbroken.csv': 'invalid'})
+        self.assertEqual(self.munch_spec.processed_count, 3)
+        self.assertEqual([column.name for column in self.munch_spec.load_spec_from_db('feed3').columns],
+                         ['name', 'count'], 'specs are registered in batches')
+        self.assertTrue(self.db.has_table('import_data_feed3'), 'spec tables are created with their specs')
+
+    def test_register_existing_specs(self):
+        self.munch_spec.register_spec_files(['feed1.csv', 'feed2.csv'])
+        self.write_spec_file('feed1', '"column name",width,datatype\nname,10,TEXT\ncount,3,INTEGER\n'
+                                      'price,7,DECIMAL(2)\n')
+
+        outcomes = self.munch_spec.register_spec_files(['feed1.csv', 'feed2.csv', 'feed3.csv'])
+        self.assertEqual(outcomes, {'feed1.csv': 'evolved', 'feed2.csv': 'unchanged', 'feed3.csv': 'registered'})
+        self.assertEqual(self.munch_spec.load_spec_from_db('feed1').columns[2].scale, 2)
+
+    def test_existing_specs_loaded_together(self):
+        self.munch_spec.register_spec_files(['feed1.csv', 'feed2.csv'])
+        self.write_spec_file('feed1', '"column name",width,datatype\nname,10,TEXT\ncount,3,INTEGER\n'
+                                      'price,7,DECIMAL(2)\n')
+        self.munch_spec.register_spec_files(['feed1.csv'])
+        self.munch_spec.load_spec_from_db = MagicMock()
+
+        outcomes = self.munch_spec.register_spec_files(['feed1.csv', 'feed2.csv'])
+        self.assertEqual(outcomes, {'feed1.csv': 'unchanged', 'feed2.csv': 'unchanged'},
+                         'the latest version of each existing spec is compared')
+        self.assertFalse(self.munch_spec.load_spec_from_db.called, 'existing specs aren\'t loaded one at a time')
+
+    def test_failed_batch_registers_specs_one_at_a_time(self):
+        self.munch_spec.register_specs = MagicMock(return_value=False)
+        self.munch_spec.persist_spec = MagicMock(side_effect=[True, False, True])
+
+        outcomes = self.munch_spec.register_spec_files(['feed1.csv', 'feed2.csv', 'feed3.csv'])
+        self.assertEqual(outcomes, {'feed1.csv': 'registered', 'feed2.csv': 'failed', 'feed3.csv': 'registered'},
+                         'a spec which can\'t be registered doesn\'t fail its batch')
+
+
+class RecordParsing(unittest.TestCase):
+    """Test validation and conversion of fixed-width records read in binary mode"""
+    def setUp(self):
+        self.spec = munch_spec.Spec('origspecformat', [munch_spec.SpecColumn('name', 10, 'TEXT'),
+                                                       munch_spec.SpecColumn('valid', 1, 'BOOLEAN'),
+                                                       munch_spec.SpecColumn('count', 3, 'INTEGER')])
+
+    def test_valid_record(self):
+        self.assertEqual(self.spec.parse_record(memoryview(b'Barzane   0-12')),
+                         ['Barzane   ', False, -12],
+                         'columns of a valid record are converted to their spec datatypes')
+
+    def test_text_column_encoding(self):
+        self.assertEqual(self.spec.parse_record('Qu\xfcxitude 1103'.encode('latin-1'), 'latin-1'),
+                         ['Qu\xfcxitude ', True, 103],
+                         'TEXT columns are decoded using the spec encoding')
+        self.assertEqual(self.spec.parse_record('Qüxitude 1103'.encode('utf-8')),
+                         ['Qüxitude ', True, 103],
+                         'column widths are measured in bytes')
+
+    def test_invalid_record(self):
+        with self.assertLogs('munch_spec', level='ERROR'):
+            self.assertIsNone(self.spec.parse_record(b'Barzane   2-12'),
+                              'a record with an invalid BOOLEAN column is rejected')
+        with self.assertLogs('munch_spec', level='ERROR'):
+            self.assertIsNone(self.spec.parse_record(b'Barzane   0 x2'),
+                              'a record with an invalid INTEGER column is rejected')
+        with self.assertLogs('munch_spec', level='ERROR'):
+            self.assertIsNone(self.spec.parse_record(b'Barzane   0-1'),
+                              'a record shorter than the spec is rejected')
+
+    def test_filler_columns_skipped(self):
+        spec = munch_spec.Spec('fillerformat', [munch_spec.SpecColumn('name', 10, 'TEXT'),
+                                                munch_spec.SpecColumn('unused', 4, 'FILLER'),
+                                                munch_spec.SpecColumn('count', 3, 'INTEGER'),
+                                                munch_spec.SpecColumn('padding', 2, 'FILLER')])
+        self.assertEqual(spec.total_col_width, 19, 'FILLER columns count towards the record width')
+        self.assertEqual([spec_column.name for spec_column in spec.columns], ['name', 'count'],
+                         'FILLER columns are not stored')
+        self.assertEqual(spec.parse_record(b'Barzane   \xff?x -12zz'), ['Barzane   ', -12],
+                         'FILLER bytes are skipped without being validated')
+
+
+class DatatypeParsing(unittest.TestCase):
+    """Test parsing DECIMAL, DATE, TIMESTAMP and FLOAT columns"""
+    def setUp(self):
+        self.spec = munch_spec.Spec('typedformat', [munch_spec.SpecColumn('price', 7, 'DECIMAL', scale=2),
+                                                    munch_spec.SpecColumn('sold_on', 10, 'DATE'),
+                                                    munch_spec.SpecColumn('sold_at', 14, 'TIMESTAMP'),
+                                                    munch_spec.SpecColumn('weight', 6, 'FLOAT')])
+
+    def test_valid_record(self):
+        self.assertEqual(self.spec.parse_record(b'00012342007-10-0120071001134712 1.5e3'),
+                         [decimal.Decimal('12.34'), datetime.date(2007, 10, 1),
+                          datetime.datetime(2007, 10, 1, 13, 47, 12), 1500.0])
+        self.assertEqual(self.spec.parse_record(memoryview(bytearray(b'00012342007-10-0120071001134712 1.5e3'))),
+                         [decimal.Decimal('12.34'), datetime.date(2007, 10, 1),
+                          datetime.datetime(2007, 10, 1, 13, 47, 12), 1500.0],
+                         'fields are parsed from a slice of a writable buffer')
+
+    def test_decimal(self):
+        parser = munch_spec.SpecColumn('price', 7, 'DECIMAL', scale=2).parser
+        self.assertEqual(parser(b'-001234'), decimal.Decimal('-12.34'), 'the decimal point is implied by the scale')
+        self.assertEqual(parser(b'  12.3 '), decimal.Decimal('12.30'), 'an explicit decimal point is allowed')
+        for field in [b'12.345 ', b'  1.2.3', b'    NaN', b'1.2e-9']:
+            with self.assertRaises(ValueError, msg='{0} is not a DECIMAL(2)'.format(field)):
+                parser(field)
+        self.assertEqual(munch_spec.SpecColumn('count', 3, 'DECIMAL').parser(b'042'), decimal.Decimal(42),
+                         'DECIMAL has a scale of 0 unless declared')
+
+    def test_date(self):
+        parser = munch_spec.SpecColumn('sold_on', 8, 'DATE').parser
+        self.assertEqual(parser(b'20071001'), datetime.date(2007, 10, 1))
+        self.assertIs(parser(b'20071001'), parser(b'20071001'), 'repeated dates are cached')
+        for field in [b'20071301', b'2007101 ', b'2007-1-1', b'        ', b'2007/10/01', b'2007x10x01', b'2007-+1-01']:
+            with self.assertRaises(ValueError, msg='{0} is not a DATE'.format(field)):
+                parser(field)
+
+    def test_timestamp(self):
+        parser = munch_spec.SpecColumn('sold_at', 26, 'TIMESTAMP').parser
+        self.assertEqual(parser(b'2007-10-01T13:47:12.345   '), datetime.datetime(2007, 10, 1, 13, 47, 12, 345000))
+        self.assertEqual(parser(b'2007-10-01 13:47:12'), datetime.datetime(2007, 10, 1, 13, 47, 12))
+        self.assertEqual(parser(b'2007-10-01T13:47:12.3456789'), datetime.datetime(2007, 10, 1, 13, 47, 12, 345678),
+                         'fractions finer than microseconds are truncated')
+        for field in [b'2007-10-01T25:47:12', b'2007-10-01T13:47', b'20071001134712x', b'20071001134712.',
+                      b'2007-10-01T13:47:12.345678x', b'2007-10-01T13:47:12.1 2', b'2007-10-01x13:47:12',
+                      b'2007-10-01T13x47x12', b'2007-10-01T +:47:12', b'2007-10-01T13:47: 1', b'200710011347+1']:
+            with self.assertRaises(ValueError, msg='{0} is not a TIMESTAMP'.format(field)):
+                parser(field)
+
+    def test_blank_nullable_fields(self):
+        spec = munch_spec.Spec('typedformat', [munch_spec.SpecColumn('price', 7, 'DECIMAL', True, scale=2),
+                                               munch_spec.SpecColumn('sold_on', 10, 'DATE', True),
+                                               munch_spec.SpecColumn('count', 3, 'INTEGER', True)])
+        self.assertEqual(spec.parse_record(b' ' * 20), [None, None, None],
+                         'blank fields of nullable columns are null')
+        with self.assertLogs('munch_spec', level='ERROR'):
+            self.assertIsNone(self.spec.parse_record(b' ' * 37),
+                              'blank fields of columns which aren\'t nullable are rejected')
+
+    def test_spec_file_datatypes(self):
+        spec = munch_spec.MunchSpec(os.getcwd() + '/fixtures/')
+        spec_column = spec.init_spec_column({'column name': 'price', 'width': '7', 'datatype': 'DECIMAL(2)'}, 2)
+        self.assertEqual((spec_column.datatype, spec_column.scale), ('DECIMAL', 2))
+        spec_column = spec.init_spec_column({'name': 'price', 'width': 7, 'datatype': 'DECIMAL', 'scale': 2},
+                                            'n/a', 'name', 'is_key')
+        self.assertEqual(spec_column.scale, 2, 'the scale is loaded from import_format_column')
+        with self.assertLogs('MunchSpecs', level='ERROR'):
+            self.assertFalse(spec.init_spec_column({'column name': 'price', 'width': '2',
+                                                    'datatype': 'DECIMAL(2)'}, 2),
+                             'the scale must fit the width')
+        self.assertIsInstance(munch_spec.get_column_sql_type(spec_column), sqlalchemy.Numeric)
+        self.assertEqual(munch_spec.get_column_sql_type(spec_column).scale, 2)
+
+    def test_scale_change_is_incompatible(self):
+        current_spec = munch_spec.Spec('typedformat', [munch_spec.SpecColumn('price', 7, 'DECIMAL', scale=2)])
+        with self.assertRaises(ValueError):
+            munch_spec.get_spec_evolution(current_spec, munch_spec.Spec(
+                'typedformat', [munch_spec.SpecColumn('price', 7, 'DECIMAL', scale=3)]))
+
+
+class SpecKeyColumns(unittest.TestCase):
+    """Test declaring the key columns which rows of a spec are upserted on"""
+    def setUp(self):
+        self.munch_spec = munch_spec.MunchSpec(os.getcwd() + '/fixtures/')
+
+    def test_key_column(self):
+        spec_column = self.munch_spec.init_spec_column({'column name': 'name', 'width': '10',
+                                                        'datatype': 'TEXT', 'key': '1'}, 2)
+        self.assertTrue(spec_column.key, 'a column with key 1 is a key column')
+        spec_column = self.munch_spec.init_spec_column({'column name': 'name', 'width': '10',
+                                                        'datatype': 'TEXT', 'key': ''}, 2)
+        self.assertFalse(spec_column.key, 'the key attribute is optional')
+        spec_column = self.munch_spec.init_spec_column({'name': 'name', 'width': 10,
+                                                        'datatype': 'TEXT', 'is_key': True}, 'n/a', 'name', 'is_key')
+        self.assertTrue(spec_column.key, 'key columns are loaded from import_format_column')
+
+    def test_invalid_key_column(self):
+        with self.assertLogs('MunchSpecs', level='ERROR'):
+            self.assertFalse(self.munch_spec.init_spec_column({'column name': 'name', 'width': '10',
+                                                               'datatype': 'TEXT', 'key': 'yes'}, 2))
+        with self.assertLogs('MunchSpecs', level='ERROR'):
+            self.assertFalse(self.munch_spec.init_spec_column({'column name': 'unused', 'width': '2',
+                                                               'datatype': 'FILLER', 'key': '1'}, 2),
+                             'FILLER columns aren\'t stored, so can\'t be keys')
+
+    def test_key_index(self):
+        spec = munch_spec.Spec('keyformat', [munch_spec.SpecColumn('name', 10, 'TEXT', key=True),
+                                             munch_spec.SpecColumn('count', 3, 'INTEGER')])
+        self.assertEqual(munch_spec.get_spec_key_index(spec),
+                         ('ux_import_data_keyformat_key', ['name']))
+        self.assertIsNone(munch_spec.get_spec_key_index(munch_spec.Spec('plainformat', spec.fields[1:])),
+                          'specs without key columns have no key index')
+
+
+class SpecEvolution(unittest.TestCase):
+    """Test validating a new version of a spec against its latest version"""
+    def setUp(self):
+        self.current_spec = munch_spec.Spec('origspecformat', [munch_spec.SpecColumn('name', 10, 'TEXT'),
+                                                               munch_spec.SpecColumn('count', 3, 'INTEGER')], 2)
+
+    def test_unchanged_spec(self):
+        spec = munch_spec.Spec('origspecformat', [munch_spec.SpecColumn('name', 10, 'TEXT'),
+                                                  munch_spec.SpecColumn('count', 3, 'INTEGER')])
+        self.assertIsNone(munch_spec.get_spec_evolution(self.current_spec, spec),
+                          'a spec file with the same layout isn\'t a new version')
+
+    def test_added_columns(self):
+        spec = munch_spec.Spec('origspecformat', [munch_spec.SpecColumn('name', 12, 'TEXT'),
+                                                  munch_spec.SpecColumn('valid', 1, 'BOOLEAN'),
+                                                  munch_spec.SpecColumn('unused', 4, 'FILLER'),
+                                                  munch_spec.SpecColumn('count', 3, 'INTEGER')])
+        self.assertEqual([column.name for column in munch_spec.get_spec_evolution(self.current_spec, spec)],
+                         ['valid'], 'new stored columns are added, and the record layout may change')
+
+    def test_incompatible_columns(self):
+        with self.assertRaises(ValueError, msg='stored columns can\'t be dropped'):
+            munch_spec.get_spec_evolution(self.current_spec,
+                                          munch_spec.Spec('origspecformat', [munch_spec.SpecColumn('name', 10, 'TEXT')]))
+        with self.assertRaises(ValueError, msg='the datatype of stored columns can\'t change'):
+            munch_spec.get_spec_evolution(self.current_spec,
+                                          munch_spec.Spec('origspecformat', [munch_spec.SpecColumn('name', 10, 'TEXT'),
+                                                                             munch_spec.SpecColumn('count', 3, 'TEXT')]))
+
+    def test_nullable_column_from_db(self):
+        spec_column = munch_spec.MunchSpec(os.getcwd() + '/fixtures/').init_spec_column(
+            {'name': 'valid', 'width': 1, 'datatype': 'BOOLEAN', 'nullable': True, 'is_key': False},
+            'n/a', 'name', 'is_key')
+        self.assertTrue(spec_column.nullable, 'columns added by a later version are nullable')
@@ -0,0 +1,41 @@
+import unittest
+from dropmunch import munch_batch, munch_spec, munch_stats
+
+
+class ImportStatsAccumulation(unittest.TestCase):
+    """Test accumulation of per-column statistics across batches"""
+    def setUp(self):
+        self.spec = munch_spec.Spec('origspecformat', [munch_spec.SpecColumn('name', 10, 'TEXT'),
+                                                       munch_spec.SpecColumn('valid', 1, 'BOOLEAN'),
+                                                       munch_spec.SpecColumn('count', 3, 'INTEGER', True)])
+        self.import_stats = munch_stats.ImportStats(self.spec)
+        self.import_stats.add_batch(munch_batch.RowBatch.from_rows(
+            self.spec, [[7, 'Foonyor', True, 1], [7, 'Barzane', False, -12]]))
+        self.import_stats.add_batch(munch_batch.RowBatch.from_rows(
+            self.spec, [[7, 'Quuxitude', True, 103], [7, 'Zed', False, None]]))
+
+    def get_row(self, column_name):
+        for row in self.import_stats.as_rows(7):
+            if row['column_name'] == column_name:
+                return row
+
+    def test_integer_stats(self):
+        row = self.get_row('count')
+        self.assertEqual((row['row_count'], row['null_count']), (4, 1), 'rows and nulls are counted')
+        self.assertEqual((row['min_value'], row['max_value'], row['sum_value']), (-12, 103, 92),
+                         'min, max and sum are accumulated for INTEGER columns')
+
+    def test_boolean_stats(self):
+        self.assertEqual(self.get_row('valid')['true_count'], 2, 'true values are counted for BOOLEAN columns')
+
+    def test_text_stats(self):
+        self.assertEqual(self.get_row('name')['max_length'], 9, 'max length is tracked for TEXT columns')
+
+    def test_resume_from_persisted_stats(self):
+        resumed = munch_stats.ImportStats(self.spec)
+        resumed.load(self.import_stats.as_rows(7))
+        resumed.add_batch(munch_batch.RowBatch.from_rows(self.spec, [[7, 'Ok', True, 500]]))
+
+        row = [row for row in resumed.as_rows(7) if row['column_name'] == 'count'][0]
+        self.assertEqual((row['row_count'], row['max_value'], row['sum_value']), (5, 500, 592),
+                         'statistics of a partially processed file are resumed')
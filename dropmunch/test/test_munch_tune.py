@@ -0,0 +1,52 @@
+import unittest
+from dropmunch import munch_roots, munch_sink, munch_tune
+from dropmunch.test import helpers
+
+
+class TuneBehavior(unittest.TestCase):
+    """Test tuning of batch sizes and workers from commit latency"""
+    def setUp(self):
+        self.tuner = munch_tune.MunchTuner(1000, min_batch_size=100, max_batch_size=2500, batch_size_step=1000,
+                                           target_commit_seconds=1.0, workers=2, min_workers=1, max_workers=3)
+
+    def test_additive_increase(self):
+        self.tuner.observe('hotcolors', 1000, 0.2)
+        self.assertEqual(self.tuner.get_batch_size('hotcolors'), 2000, 'fast commits grow the batch size')
+        self.tuner.observe('hotcolors', 2000, 0.2)
+        self.assertEqual(self.tuner.get_batch_size('hotcolors'), 2500, 'the batch size is bounded')
+        self.assertEqual(self.tuner.workers, 3, 'a worker is added once every worker committed a batch')
+
+    def test_partial_batch_does_not_grow(self):
+        self.tuner.observe('hotcolors', 10, 0.01)
+        self.assertEqual(self.tuner.get_batch_size('hotcolors'), 1000,
+                         'the end of a file says nothing about larger batches')
+
+    def test_multiplicative_decrease(self):
+        self.tuner.observe('hotcolors', 1000, 2.5)
+        self.assertEqual(self.tuner.get_batch_size('hotcolors'), 500, 'slow commits halve the batch size')
+        self.assertEqual(self.tuner.workers, 1, 'slow commits halve the workers')
+        for _ in range(5):
+            self.tuner.observe('hotcolors', 100, 2.5)
+        self.assertEqual(self.tuner.get_batch_size('hotcolors'), 100, 'the batch size is bounded')
+        self.assertEqual(self.tuner.get_batch_size('coldcolors'), 1000, 'each spec table is tuned on its own')
+
+    def test_import_log_values(self):
+        self.tuner.observe('hotcolors', 1000, 0.5)
+        values = self.tuner.get_import_log_values('hotcolors', 2, 0.5, 1500)
+        self.assertEqual(values, dict(batch_size=2000, workers=2, avg_commit_seconds=0.25, rows_per_second=3000.0))
+
+    def test_tuning_disabled(self):
+        config = helpers.get_config()
+        self.assertIsNone(munch_tune.create_tuner(config, 10000), 'batch sizes are only tuned when enabled')
+
+    def test_sqlite_sink_is_not_tuned_past_one_worker(self):
+        config = helpers.get_config('[tune]\nenabled = true\nmax_workers = 8\n'
+                                    '[root:feeda]\ndirectory = /srv/feeda\n')
+        roots = munch_roots.create_roots(config, sink=munch_sink.SqliteSink(':memory:'))
+
+        self.assertEqual((roots.get_workers(), roots.get_max_workers()), (1, 1))
+        self.assertIs(roots.roots[0].munch_data.tuner, roots.tuner, 'roots share a tuner')
+
+
+if __name__ == '__main__':
+    unittest.main()
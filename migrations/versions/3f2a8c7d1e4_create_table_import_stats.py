@@ -0,0 +1,39 @@
+"""create table import_stats
+
+Revision ID: 3f2a8c7d1e4
+Revises: 5498dae6d7b
+Create Date: 2026-10-19 12:30:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3f2a8c7d1e4'
+down_revision = '5498dae6d7b'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'import_stats',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('import_log_id', sa.Integer, nullable=False),
+        sa.Column('column_name', sa.String(15), nullable=False),
+        sa.Column('row_count', sa.BigInteger, nullable=False, default=0),
+        sa.Column('null_count', sa.BigInteger, nullable=False, default=0),
+        sa.Column('min_value', sa.BigInteger, nullable=True),
+        sa.Column('max_value', sa.BigInteger, nullable=True),
+        sa.Column('sum_value', sa.Numeric, nullable=True),
+        sa.Column('true_count', sa.BigInteger, nullable=True),
+        sa.Column('max_length', sa.Integer, nullable=True),
+        sa.UniqueConstraint('import_log_id', 'column_name', name='uq_import_stats_column')
+    )
+    op.create_foreign_key(
+            "fk_import_log_ist", "import_stats",
+            "import_log", ["import_log_id"], ["id"])
+
+def downgrade():
+    op.drop_table('import_stats')
@@ -0,0 +1,30 @@
+"""add claim columns to import_log
+
+Revision ID: 4b7e1d2c9f0
+Revises: 3f2a8c7d1e4
+Create Date: 2026-10-19 13:10:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4b7e1d2c9f0'
+down_revision = '3f2a8c7d1e4'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('import_log', sa.Column('claimed_by', sa.Text, nullable=True))
+    op.add_column('import_log', sa.Column('lease_expires', sa.DateTime(timezone=True), nullable=True))
+    # nodes sharing a drop directory may discover the same data file at once -
+    # only one of them may create its import_log row
+    op.create_unique_constraint('uq_import_log_format_date', 'import_log',
+                                ['import_format_id', 'creation_date'])
+
+def downgrade():
+    op.drop_constraint('uq_import_log_format_date', 'import_log', 'unique')
+    op.drop_column('import_log', 'lease_expires')
+    op.drop_column('import_log', 'claimed_by')
@@ -0,0 +1,23 @@
+"""add failure_reason to import_log
+
+Revision ID: 52c9e8a1b3d
+Revises: 4b7e1d2c9f0
+Create Date: 2026-10-19 13:40:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '52c9e8a1b3d'
+down_revision = '4b7e1d2c9f0'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('import_log', sa.Column('failure_reason', sa.Text, nullable=True))
+
+def downgrade():
+    op.drop_column('import_log', 'failure_reason')
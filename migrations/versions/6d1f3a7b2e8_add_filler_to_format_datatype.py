@@ -0,0 +1,32 @@
+"""add FILLER to format_datatype
+
+Revision ID: 6d1f3a7b2e8
+Revises: 52c9e8a1b3d
+Create Date: 2026-10-19 15:10:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6d1f3a7b2e8'
+down_revision = '52c9e8a1b3d'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # postgres doesn't allow a new enum value to be used in the transaction which adds it
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE format_datatype ADD VALUE IF NOT EXISTS 'FILLER'")
+
+def downgrade():
+    # enum values can't be dropped - the type is recreated without FILLER.
+    # Specs with FILLER columns can't be represented, so their columns are deleted
+    op.execute("DELETE FROM import_format_column WHERE datatype = 'FILLER'")
+    op.execute("ALTER TYPE format_datatype RENAME TO format_datatype_old")
+    op.execute("CREATE TYPE format_datatype AS ENUM ('TEXT', 'BOOLEAN', 'INTEGER')")
+    op.execute("ALTER TABLE import_format_column ALTER COLUMN datatype "
+               "TYPE format_datatype USING datatype::text::format_datatype")
+    op.execute("DROP TYPE format_datatype_old")
@@ -0,0 +1,30 @@
+"""add tuning columns to import_log
+
+Revision ID: 7c3e9a1d5f2
+Revises: 6d1f3a7b2e8
+Create Date: 2026-10-19 16:20:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7c3e9a1d5f2'
+down_revision = '6d1f3a7b2e8'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # parameters a data file was loaded with, when batch sizes and workers are tuned - see munch_tune
+    op.add_column('import_log', sa.Column('batch_size', sa.Integer, nullable=True))
+    op.add_column('import_log', sa.Column('workers', sa.Integer, nullable=True))
+    op.add_column('import_log', sa.Column('avg_commit_seconds', sa.Float, nullable=True))
+    op.add_column('import_log', sa.Column('rows_per_second', sa.Float, nullable=True))
+
+def downgrade():
+    op.drop_column('import_log', 'rows_per_second')
+    op.drop_column('import_log', 'avg_commit_seconds')
+    op.drop_column('import_log', 'workers')
+    op.drop_column('import_log', 'batch_size')
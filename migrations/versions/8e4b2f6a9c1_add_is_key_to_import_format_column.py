@@ -0,0 +1,25 @@
+"""add is_key to import_format_column
+
+Revision ID: 8e4b2f6a9c1
+Revises: 7c3e9a1d5f2
+Create Date: 2026-10-19 17:05:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8e4b2f6a9c1'
+down_revision = '7c3e9a1d5f2'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # rows of a spec with key columns are upserted on them - see munch_sink
+    op.add_column('import_format_column', sa.Column('is_key', sa.Boolean, nullable=False,
+                                                    server_default=sa.false()))
+
+def downgrade():
+    op.drop_column('import_format_column', 'is_key')
@@ -0,0 +1,33 @@
+"""add spec versions
+
+Revision ID: 9a5c3e7b1d4
+Revises: 8e4b2f6a9c1
+Create Date: 2026-10-19 17:50:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9a5c3e7b1d4'
+down_revision = '8e4b2f6a9c1'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # existing specs, their columns and import_log rows are version 1
+    op.add_column('import_format', sa.Column('version', sa.Integer, nullable=False, server_default='1'))
+    op.add_column('import_format_column', sa.Column('version', sa.Integer, nullable=False, server_default='1'))
+    op.add_column('import_log', sa.Column('import_format_version', sa.Integer, nullable=False, server_default='1'))
+    op.create_index('ix_import_format_column_version', 'import_format_column', ['import_format_id', 'version'])
+
+def downgrade():
+    # only the latest version of each spec's columns can be kept
+    op.execute("DELETE FROM import_format_column c USING import_format f "
+               "WHERE c.import_format_id = f.id AND c.version <> f.version")
+    op.drop_index('ix_import_format_column_version', 'import_format_column')
+    op.drop_column('import_log', 'import_format_version')
+    op.drop_column('import_format_column', 'version')
+    op.drop_column('import_format', 'version')
@@ -0,0 +1,39 @@
+"""add DECIMAL, DATE, TIMESTAMP and FLOAT to format_datatype
+
+Revision ID: b3d7f1a9e2c
+Revises: 9a5c3e7b1d4
+Create Date: 2026-10-19 18:30:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b3d7f1a9e2c'
+down_revision = '9a5c3e7b1d4'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+new_datatypes = ['DECIMAL', 'DATE', 'TIMESTAMP', 'FLOAT']
+
+
+def upgrade():
+    # postgres doesn't allow a new enum value to be used in the transaction which adds it
+    with op.get_context().autocommit_block():
+        for datatype in new_datatypes:
+            op.execute("ALTER TYPE format_datatype ADD VALUE IF NOT EXISTS '{0}'".format(datatype))
+    # digits after the decimal point of DECIMAL columns
+    op.add_column('import_format_column', sa.Column('scale', sa.Integer, nullable=True))
+
+def downgrade():
+    # enum values can't be dropped - the type is recreated without the new datatypes.
+    # Columns of the new datatypes can't be represented, so they are deleted
+    op.execute("DELETE FROM import_format_column WHERE datatype::text IN ({0})"
+               .format(', '.join("'{0}'".format(datatype) for datatype in new_datatypes)))
+    op.drop_column('import_format_column', 'scale')
+    op.execute("ALTER TYPE format_datatype RENAME TO format_datatype_old")
+    op.execute("CREATE TYPE format_datatype AS ENUM ('TEXT', 'BOOLEAN', 'INTEGER', 'FILLER')")
+    op.execute("ALTER TABLE import_format_column ALTER COLUMN datatype "
+               "TYPE format_datatype USING datatype::text::format_datatype")
+    op.execute("DROP TYPE format_datatype_old")